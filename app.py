@@ -12,98 +12,128 @@ from logstash.logstash_stack import LogstashStack
 from filebeat.filebeat_stack import FilebeatStack
 from athena.athena_stack import AthenaStack
 from kibana.kibana_stack import KibanaStack
+from helpers.prerequisites import resolve_prerequisites, timed, print_timing_report
 
 app = core.App()
 
-# Vpc stack
-vpc_stack = VpcStack(
-    app,
-    "elkk-vpc",
-    env=core.Environment(
-        account=os.environ["CDK_DEFAULT_ACCOUNT"],
-        region=os.environ["CDK_DEFAULT_REGION"],
-    ),
+# resolve the lookups for all stacks concurrently before building them
+prerequisites = resolve_prerequisites(
+    app, refresh=bool(app.node.try_get_context("refresh_discovery"))
 )
+discovery = prerequisites["results"]["discovery"]
+
+# lookups used by each stack, for the timing report
+stack_lookups = {
+    "elkk-kafka": ["external_ip", "kafka_service_role"],
+    "elkk-filebeat": ["discovery"],
+    "elkk-elastic": ["external_ip", "elastic_service_role"],
+    "elkk-logstash": ["discovery", "external_ip"],
+}
+construct_timings = {}
+
+# Vpc stack
+with timed(construct_timings, "elkk-vpc"):
+    vpc_stack = VpcStack(
+        app,
+        "elkk-vpc",
+        env=core.Environment(
+            account=os.environ["CDK_DEFAULT_ACCOUNT"],
+            region=os.environ["CDK_DEFAULT_REGION"],
+        ),
+    )
 
 # Kafka stack
-kafka_stack = KafkaStack(
-    app,
-    "elkk-kafka",
-    vpc_stack,
-    client=True,
-    env=core.Environment(
-        account=os.environ["CDK_DEFAULT_ACCOUNT"],
-        region=os.environ["CDK_DEFAULT_REGION"],
-    ),
-)
+with timed(construct_timings, "elkk-kafka"):
+    kafka_stack = KafkaStack(
+        app,
+        "elkk-kafka",
+        vpc_stack,
+        client=True,
+        env=core.Environment(
+            account=os.environ["CDK_DEFAULT_ACCOUNT"],
+            region=os.environ["CDK_DEFAULT_REGION"],
+        ),
+    )
 kafka_stack.add_dependency(vpc_stack)
 
 # Filebeat stack (Filebeat on EC2)
-filebeat_stack = FilebeatStack(
-    app,
-    "elkk-filebeat",
-    vpc_stack,
-    kafka_stack,
-    env=core.Environment(
-        account=os.environ["CDK_DEFAULT_ACCOUNT"],
-        region=os.environ["CDK_DEFAULT_REGION"],
-    ),
-)
+with timed(construct_timings, "elkk-filebeat"):
+    filebeat_stack = FilebeatStack(
+        app,
+        "elkk-filebeat",
+        vpc_stack,
+        kafka_stack,
+        discovery=discovery,
+        env=core.Environment(
+            account=os.environ["CDK_DEFAULT_ACCOUNT"],
+            region=os.environ["CDK_DEFAULT_REGION"],
+        ),
+    )
 filebeat_stack.add_dependency(kafka_stack)
 
 # Elastic stack
-elastic_stack = ElasticStack(
-    app,
-    "elkk-elastic",
-    vpc_stack,
-    client=True,
-    env=core.Environment(
-        account=os.environ["CDK_DEFAULT_ACCOUNT"],
-        region=os.environ["CDK_DEFAULT_REGION"],
-    ),
-)
+with timed(construct_timings, "elkk-elastic"):
+    elastic_stack = ElasticStack(
+        app,
+        "elkk-elastic",
+        vpc_stack,
+        client=True,
+        env=core.Environment(
+            account=os.environ["CDK_DEFAULT_ACCOUNT"],
+            region=os.environ["CDK_DEFAULT_REGION"],
+        ),
+    )
 elastic_stack.add_dependency(vpc_stack)
 
 # Kibana stack
-kibana_stack = KibanaStack(
-    app,
-    "elkk-kibana",
-    vpc_stack,
-    elastic_stack,
-    update_lambda_zip=False,
-    env=core.Environment(
-        account=os.environ["CDK_DEFAULT_ACCOUNT"],
-        region=os.environ["CDK_DEFAULT_REGION"],
-    ),
-)
+with timed(construct_timings, "elkk-kibana"):
+    kibana_stack = KibanaStack(
+        app,
+        "elkk-kibana",
+        vpc_stack,
+        elastic_stack,
+        update_lambda_zip=False,
+        env=core.Environment(
+            account=os.environ["CDK_DEFAULT_ACCOUNT"],
+            region=os.environ["CDK_DEFAULT_REGION"],
+        ),
+    )
 kibana_stack.add_dependency(elastic_stack)
 
 # Athena stack
-athena_stack = AthenaStack(
-    app,
-    "elkk-athena",
-    env=core.Environment(
-        account=os.environ["CDK_DEFAULT_ACCOUNT"],
-        region=os.environ["CDK_DEFAULT_REGION"],
-    ),
-)
+with timed(construct_timings, "elkk-athena"):
+    athena_stack = AthenaStack(
+        app,
+        "elkk-athena",
+        env=core.Environment(
+            account=os.environ["CDK_DEFAULT_ACCOUNT"],
+            region=os.environ["CDK_DEFAULT_REGION"],
+        ),
+    )
 athena_stack.add_dependency(vpc_stack)
 
 # Logstash stack
-logstash_stack = LogstashStack(
-    app,
-    "elkk-logstash",
-    vpc_stack,
-    logstash_ec2=False,
-    logstash_fargate=True,
-    env=core.Environment(
-        account=os.environ["CDK_DEFAULT_ACCOUNT"],
-        region=os.environ["CDK_DEFAULT_REGION"],
-    ),
-)
+with timed(construct_timings, "elkk-logstash"):
+    logstash_stack = LogstashStack(
+        app,
+        "elkk-logstash",
+        vpc_stack,
+        logstash_ec2=False,
+        logstash_fargate=True,
+        discovery=discovery,
+        env=core.Environment(
+            account=os.environ["CDK_DEFAULT_ACCOUNT"],
+            region=os.environ["CDK_DEFAULT_REGION"],
+        ),
+    )
 logstash_stack.add_dependency(kafka_stack)
 logstash_stack.add_dependency(elastic_stack)
 logstash_stack.add_dependency(athena_stack)
 
-# synth the app
-app.synth()
+# synth the app, timed apart from the stacks
+synth_timings = {}
+with timed(synth_timings, "synth"):
+    app.synth()
+print_timing_report(
+    construct_timings, prerequisites, stack_lookups, synth_timings["synth"]
+)
@@ -12,11 +12,9 @@ from helpers.constants import constants
 from helpers.functions import (
     ensure_service_linked_role,
     user_data_init,
+    get_external_ip,
     instance_add_log_permissions,
 )
-import urllib.request
-
-external_ip = urllib.request.urlopen("https://ident.me").read().decode("utf8")
 
 
 class ElasticStack(core.Stack):
@@ -53,6 +51,8 @@ class ElasticStack(core.Stack):
         )
         core.Tag.add(elastic_client_security_group, "project", constants["PROJECT_TAG"])
         core.Tag.add(elastic_client_security_group, "Name", "elastic_client_sg")
+        # operator public ip for ssh
+        external_ip = get_external_ip(self)
         # Open port 22 for SSH
         elastic_client_security_group.add_ingress_rule(
             ec2.Peer.ipv4(f"{external_ip}/32"), ec2.Port.tcp(22), "from own public ip",
@@ -1,7 +1,6 @@
 # import modules
 import os.path
-import urllib.request
-
+import json
 from aws_cdk import (
     core,
     aws_ec2 as ec2,
@@ -10,22 +9,32 @@ from aws_cdk import (
 )
 from helpers.functions import (
     file_updated,
-    kafka_get_brokers,
+    yaml_settings,
     user_data_init,
     instance_add_log_permissions,
 )
 from helpers.constants import constants
+from helpers.discovery import discover
 
 dirname = os.path.dirname(__file__)
-external_ip = urllib.request.urlopen("https://ident.me").read().decode("utf8")
 
 
 class FilebeatStack(core.Stack):
     def __init__(
-        self, scope: core.Construct, id: str, vpc_stack, kafka_stack, **kwargs
+        self,
+        scope: core.Construct,
+        id: str,
+        vpc_stack,
+        kafka_stack,
+        discovery: dict = None,
+        **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
+        # existing resources from the discovery
+        if discovery is None:
+            discovery = discover()
+
         # log generator asset
         log_generator_py = assets.Asset(
             self, "log_generator", path=os.path.join(dirname, "log_generator.py")
@@ -36,13 +45,44 @@ class FilebeatStack(core.Stack):
             "log_generator_requirements_txt",
             path=os.path.join(dirname, "log_generator_requirements.txt"),
         )
+        # log generator example traffic shape asset
+        traffic_json = assets.Asset(
+            self, "traffic_json", path=os.path.join(dirname, "traffic.json")
+        )
+        # kafka output producer benchmark and the profiles it compares
+        producer_benchmark_py = assets.Asset(
+            self,
+            "producer_benchmark",
+            path=os.path.join(dirname, "producer_benchmark.py"),
+        )
+        kafka_profiles_asset = os.path.join(dirname, "kafka_profiles.json.asset")
+        with open(kafka_profiles_asset, "w") as f:
+            json.dump(constants["FILEBEAT_KAFKA_PROFILES"], f, indent=2)
+        kafka_profiles_json = assets.Asset(
+            self, "kafka_profiles_json", path=kafka_profiles_asset
+        )
 
         # get kakfa brokers
-        kafka_brokers = f'''"{kafka_get_brokers().replace(",", '", "')}"'''
+        kafka_brokers = f'''"{discovery["kafka_brokers"].replace(",", '", "')}"'''
+
+        # kafka output producer settings
+        kafka_profiles = constants["FILEBEAT_KAFKA_PROFILES"]
+        kafka_producer = yaml_settings(
+            kafka_profiles[constants["FILEBEAT_KAFKA_PROFILE"]], indent=2
+        )
 
         # update filebeat.yml to .asset
         filebeat_yml_asset = file_updated(
-            os.path.join(dirname, "filebeat.yml"), {"$kafka_brokers": kafka_brokers},
+            os.path.join(dirname, "filebeat.yml"),
+            {
+                "$kafka_brokers": kafka_brokers,
+                "$kafka_producer": kafka_producer or "# filebeat defaults",
+                "$filestream": yaml_settings(
+                    constants["FILEBEAT_FILESTREAM"], indent=2
+                ),
+                "$filebeat_queue": yaml_settings(constants["FILEBEAT_QUEUE"]),
+                "$http_port": str(constants["FILEBEAT_HTTP_PORT"]),
+            },
         )
         filebeat_yml = assets.Asset(self, "filebeat_yml", path=filebeat_yml_asset)
         elastic_repo = assets.Asset(
@@ -81,6 +121,9 @@ class FilebeatStack(core.Stack):
         elastic_repo.grant_read(fb_instance)
         log_generator_py.grant_read(fb_instance)
         log_generator_requirements_txt.grant_read(fb_instance)
+        traffic_json.grant_read(fb_instance)
+        producer_benchmark_py.grant_read(fb_instance)
+        kafka_profiles_json.grant_read(fb_instance)
         # add commands to the userdata
         fb_userdata.add_commands(
             # get setup assets files
@@ -88,14 +131,25 @@ class FilebeatStack(core.Stack):
             f"aws s3 cp s3://{elastic_repo.s3_bucket_name}/{elastic_repo.s3_object_key} /home/ec2-user/elastic.repo",
             f"aws s3 cp s3://{log_generator_py.s3_bucket_name}/{log_generator_py.s3_object_key} /home/ec2-user/log_generator.py",
             f"aws s3 cp s3://{log_generator_requirements_txt.s3_bucket_name}/{log_generator_requirements_txt.s3_object_key} /home/ec2-user/requirements.txt",
+            f"aws s3 cp s3://{traffic_json.s3_bucket_name}/{traffic_json.s3_object_key} /home/ec2-user/traffic.json",
+            f"aws s3 cp s3://{producer_benchmark_py.s3_bucket_name}/{producer_benchmark_py.s3_object_key} /home/ec2-user/producer_benchmark.py",
+            f"aws s3 cp s3://{kafka_profiles_json.s3_bucket_name}/{kafka_profiles_json.s3_object_key} /home/ec2-user/kafka_profiles.json",
             # get python3
             "yum install python3 -y",
             # get pip
             "yum install python-pip -y",
-            # make log generator executable
-            "chmod +x /home/ec2-user/log_generator.py",
+            # make log generator and benchmark executable
+            "chmod +x /home/ec2-user/log_generator.py /home/ec2-user/producer_benchmark.py",
             # get log generator requirements
             "python3 -m pip install -r /home/ec2-user/requirements.txt",
+            # kafka tools, for the benchmark to measure bytes on the broker disks
+            "yum install java-1.8.0 -y",
+            f'wget https://www-us.apache.org/dist/kafka/{constants["KAFKA_DOWNLOAD_VERSION"].split("-")[-1]}/{constants["KAFKA_DOWNLOAD_VERSION"]}.tgz',
+            f"tar -xvf {constants['KAFKA_DOWNLOAD_VERSION']}.tgz",
+            f"mv {constants['KAFKA_DOWNLOAD_VERSION']} /opt",
+            f"rm {constants['KAFKA_DOWNLOAD_VERSION']}.tgz",
+            # brokers for the log generator kafka output
+            f"echo 'export KAFKA_BROKERS={discovery['kafka_brokers']}' >> /home/ec2-user/.bashrc",
             # Filebeat
             "rpm --import https://packages.elastic.co/GPG-KEY-elasticsearch",
             # move Filebeat repo file
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+# get modules
+import os
+import ssl
+import json
+import argparse
+import datetime
+import collections
+import urllib.request
+
+# initiate the parse
+parser = argparse.ArgumentParser(
+    description="Measure the latency of a traced log generator run to elasticsearch and s3"
+)
+parser.add_argument(
+    "-r",
+    "--run",
+    dest="run",
+    help="Trace run id printed by log_generator.py --trace",
+    type=str,
+    required=True,
+)
+parser.add_argument(
+    "-e",
+    "--event",
+    dest="event_type",
+    help="Logged event type, the kafka topic",
+    type=str,
+    choices=["apachelog", "appevent"],
+    default="apachelog",
+)
+parser.add_argument(
+    "--endpoint",
+    dest="endpoint",
+    help="Elasticsearch endpoint, defaults to $ELASTIC_ENDPOINT",
+    type=str,
+    default=os.environ.get("ELASTIC_ENDPOINT", ""),
+)
+parser.add_argument(
+    "--bucket",
+    dest="bucket",
+    help="Athena bucket logstash writes to, defaults to $ATHENA_BUCKET",
+    type=str,
+    default=os.environ.get("ATHENA_BUCKET", ""),
+)
+parser.add_argument(
+    "--hours",
+    dest="hours",
+    help="Only read s3 objects written in the last hours",
+    type=float,
+    default=24,
+)
+parser.add_argument(
+    "--sign",
+    dest="sign",
+    help="Sign elasticsearch requests with the aws credentials",
+    action="store_true",
+)
+parser.add_argument(
+    "--insecure",
+    dest="insecure",
+    help="Don't verify the elasticsearch certificate, as through an ssh tunnel",
+    action="store_true",
+)
+
+# events fetched per elasticsearch page
+PAGE_SIZE = 5000
+# the traced fields
+TRACE_FIELDS = [
+    "doc.trace",
+    "agent.timestamp",
+    "kafka.timestamp",
+    "logstash.timestamp",
+]
+
+
+def seconds(value) -> float:
+    """ epoch seconds from an iso timestamp or epoch milliseconds """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000
+    value = value.replace("Z", "+00:00")
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def es_request(
+    args: argparse.Namespace, path: str, body: dict, method: str = "POST"
+) -> dict:
+    """ send a json body to elasticsearch """
+    endpoint = args.endpoint
+    if "://" not in endpoint:
+        endpoint = f"https://{endpoint}"
+    url = f"{endpoint.rstrip('/')}{path}"
+    data = json.dumps(body).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if args.sign:
+        # only needed to sign
+        import boto3
+        from botocore.auth import SigV4Auth
+        from botocore.awsrequest import AWSRequest
+
+        session = boto3.session.Session()
+        request = AWSRequest(method=method, url=url, data=data, headers=headers)
+        SigV4Auth(session.get_credentials(), "es", session.region_name).add_auth(
+            request
+        )
+        headers = dict(request.headers)
+    context = ssl._create_unverified_context() if args.insecure else None
+    request = urllib.request.Request(url, data=data, headers=headers, method=method)
+    with urllib.request.urlopen(request, context=context) as response:
+        return json.loads(response.read())
+
+
+def es_traces(args: argparse.Namespace) -> list:
+    """ the traced events of the run indexed in elasticsearch """
+    traces = []
+    page = es_request(
+        args,
+        f"/elkk-{args.event_type}-*/_search?scroll=1m",
+        {
+            "size": PAGE_SIZE,
+            "_source": TRACE_FIELDS,
+            "query": {"term": {"doc.trace.run.keyword": args.run}},
+        },
+    )
+    try:
+        while page["hits"]["hits"]:
+            traces.extend(hit["_source"] for hit in page["hits"]["hits"])
+            page = es_request(
+                args,
+                "/_search/scroll",
+                {"scroll": "1m", "scroll_id": page["_scroll_id"]},
+            )
+    finally:
+        # free the search context rather than wait for it to expire
+        es_request(
+            args, "/_search/scroll", {"scroll_id": page["_scroll_id"]}, "DELETE"
+        )
+    return traces
+
+
+def s3_traces(args: argparse.Namespace) -> list:
+    """ the traced events of the run in the recent s3 objects, with the time
+    each object was written """
+    import boto3
+
+    s3_client = boto3.client("s3")
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        hours=args.hours
+    )
+    decoder = json.JSONDecoder()
+    traces = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    prefix = f"elkk-{args.event_type}/"
+    for page in paginator.paginate(Bucket=args.bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["LastModified"] < since:
+                continue
+            body = s3_client.get_object(Bucket=args.bucket, Key=obj["Key"])["Body"]
+            text = body.read().decode("utf-8")
+            # the json codec writes events back to back, maybe with new lines
+            position = 0
+            while position < len(text):
+                if text[position].isspace():
+                    position += 1
+                    continue
+                event, position = decoder.raw_decode(text, position)
+                trace = event.get("doc", {}).get("trace", {})
+                if trace.get("run") == args.run:
+                    event["s3"] = {"timestamp": obj["LastModified"].timestamp()}
+                    traces.append(event)
+    return traces
+
+
+def percentiles(name: str, values: list):
+    """ print the p50, p95 and p99 of latencies in seconds """
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        print(f"  {name:28} no events")
+        return
+    p50, p95, p99 = (
+        values[min(len(values) - 1, int(len(values) * percent / 100))]
+        for percent in (50, 95, 99)
+    )
+    print(
+        f"  {name:28} p50 {p50 * 1000:10,.1f}  p95 {p95 * 1000:10,.1f}"
+        f"  p99 {p99 * 1000:10,.1f}  ms  ({len(values):,} events)"
+    )
+
+
+def hop(event: dict, start: str, end: str) -> float:
+    """ latency between two timestamps of an event """
+    times = {
+        "emit": event["doc"]["trace"]["emit"] / 1e6,
+        "agent": seconds(event.get("agent", {}).get("timestamp")),
+        "kafka": seconds(event.get("kafka", {}).get("timestamp")),
+        "logstash": seconds(event.get("logstash", {}).get("timestamp")),
+        "s3": event.get("s3", {}).get("timestamp"),
+    }
+    if times[start] is None or times[end] is None:
+        return None
+    return times[end] - times[start]
+
+
+def sequence_report(traces: list):
+    """ print missing and duplicated events from the sequence numbers of each worker """
+    seen = collections.defaultdict(collections.Counter)
+    for event in traces:
+        trace = event["doc"]["trace"]
+        seen[trace["worker"]][trace["seq"]] += 1
+    for worker, sequence in sorted(seen.items()):
+        # events after the last one seen can't be told from events still in flight
+        missing = max(sequence) + 1 - len(sequence)
+        duplicated = sum(count - 1 for count in sequence.values())
+        print(
+            f"  worker {worker}: {len(sequence):,} events up to {max(sequence):,},"
+            f" {missing:,} missing, {duplicated:,} duplicated"
+        )
+
+
+def main():
+    args = parser.parse_args()
+    if not args.endpoint and not args.bucket:
+        parser.error("Needs an elasticsearch --endpoint, an s3 --bucket or both")
+
+    if args.endpoint:
+        traces = es_traces(args)
+        print(f"elasticsearch elkk-{args.event_type}-*, run {args.run}")
+        # logstash stamps the events before its outputs, so this doesn't
+        # include indexing into elasticsearch
+        percentiles("emit to logstash", [hop(e, "emit", "logstash") for e in traces])
+        percentiles("generator to filebeat", [hop(e, "emit", "agent") for e in traces])
+        percentiles("filebeat to kafka", [hop(e, "agent", "kafka") for e in traces])
+        percentiles("kafka to logstash", [hop(e, "kafka", "logstash") for e in traces])
+        sequence_report(traces)
+
+    if args.bucket:
+        traces = s3_traces(args)
+        print(f"s3 {args.bucket}/elkk-{args.event_type}/, run {args.run}")
+        percentiles("emit to s3", [hop(e, "emit", "s3") for e in traces])
+        percentiles("logstash to s3", [hop(e, "logstash", "s3") for e in traces])
+        sequence_report(traces)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,24 @@
 import time
 import datetime
 import random
-from faker import Faker
+from array import array
+from functools import partial
 from tzlocal import get_localzone
 from pathlib import Path
 import argparse
 import uuid
+import math
+import os
+import gzip
 import json
+import itertools
+import collections
+import signal
+import multiprocessing
+import queue
 import sys
 
 local = get_localzone()
-faker = Faker()
 
 # initiate the parse
 parser = argparse.ArgumentParser()
@@ -40,7 +48,7 @@ parser.add_argument(
     dest="output_type",
     help="Write to a Log file or to STDOUT",
     type=str,
-    choices=["LOG", "CONSOLE"],
+    choices=["LOG", "CONSOLE", "KAFKA", "DATASET"],
     default="LOG",
 )
 
@@ -62,10 +70,204 @@ parser.add_argument(
     type=files_range,
     default=1,
 )
+parser.add_argument(
+    "-i",
+    "--interval",
+    dest="interval",
+    help="Seconds to wait between files",
+    type=float,
+    default=30,
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    dest="workers",
+    help="Number of processes generating events, each writing its own files",
+    type=int,
+    default=1,
+)
+# kafka output
+parser.add_argument(
+    "--brokers",
+    dest="brokers",
+    help="Kafka bootstrap brokers, defaults to $KAFKA_BROKERS",
+    type=str,
+    default=os.environ.get("KAFKA_BROKERS", ""),
+)
+parser.add_argument(
+    "--topic",
+    dest="topic",
+    help="Kafka topic to publish to, defaults to the event type",
+    type=str,
+)
+parser.add_argument(
+    "--linger-ms",
+    dest="linger_ms",
+    help="How long the producer waits to fill a batch",
+    type=int,
+    default=20,
+)
+parser.add_argument(
+    "--batch-kb",
+    dest="batch_kb",
+    help="Largest producer batch per partition in KB",
+    type=int,
+    default=1024,
+)
+parser.add_argument(
+    "--compression",
+    dest="compression",
+    help="Producer batch compression",
+    type=str,
+    choices=["none", "gzip", "snappy", "lz4", "zstd"],
+    default="lz4",
+)
+parser.add_argument(
+    "--acks",
+    dest="acks",
+    help="Broker acknowledgements each batch waits for",
+    type=str,
+    choices=["0", "1", "all"],
+    default="1",
+)
+# streaming mode
+parser.add_argument(
+    "-s",
+    "--stream",
+    dest="stream",
+    help="Append events to a rotating log at a target rate until stopped",
+    action="store_true",
+)
+parser.add_argument(
+    "--rate",
+    dest="rate",
+    help="Target events per second when streaming",
+    type=float,
+    default=1000,
+)
+parser.add_argument(
+    "--profile",
+    dest="profile",
+    help="How the streaming rate changes over time",
+    type=str,
+    choices=["constant", "ramp", "step", "spike"],
+    default="constant",
+)
+parser.add_argument(
+    "--period",
+    dest="period",
+    help="Seconds to ramp up over, per step, or between spikes",
+    type=float,
+    default=60,
+)
+parser.add_argument(
+    "--steps",
+    dest="steps",
+    help="Number of equal steps up to the target rate",
+    type=int,
+    default=5,
+)
+parser.add_argument(
+    "--spike",
+    dest="spike",
+    help="Multiple of the target rate during a spike",
+    type=float,
+    default=5,
+)
+parser.add_argument(
+    "--spike-seconds",
+    dest="spike_seconds",
+    help="How long each spike lasts",
+    type=float,
+    default=10,
+)
+parser.add_argument(
+    "--rotate-mb",
+    dest="rotate_mb",
+    help="Start a new log file after this many MB, 0 to disable",
+    type=float,
+    default=100,
+)
+parser.add_argument(
+    "--rotate-seconds",
+    dest="rotate_seconds",
+    help="Start a new log file after this many seconds, 0 to disable",
+    type=float,
+    default=0,
+)
+parser.add_argument(
+    "--keep",
+    dest="keep",
+    help="Number of rotated log files to keep, 0 keeps them all",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    "--duration",
+    dest="duration",
+    help="Seconds to stream for, 0 runs until stopped",
+    type=float,
+    default=0,
+)
+
+# repeatable datasets
+def simulated_time(value: str) -> datetime.datetime:
+    """ an iso format date and time, in utc unless it has an offset """
+    when = datetime.datetime.fromisoformat(value)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return when
 
 
-# read the args
-args = parser.parse_args()
+parser.add_argument(
+    "--trace",
+    dest="trace",
+    help="Add a run id, emit time and sequence number to each event",
+    action="store_true",
+)
+parser.add_argument(
+    "--traffic",
+    dest="traffic",
+    help="Json file setting the popularity, cardinality and shape of the traffic",
+    type=str,
+)
+parser.add_argument(
+    "--seed",
+    dest="seed",
+    help="Seed for the generated events, the same seed gives the same events",
+    type=int,
+)
+parser.add_argument(
+    "--start",
+    dest="start",
+    help="Timestamp events from this iso date and time, on a simulated clock",
+    type=simulated_time,
+)
+parser.add_argument(
+    "--end",
+    dest="end",
+    help="When the simulated clock stops, defaults to now",
+    type=simulated_time,
+)
+parser.add_argument(
+    "--speed",
+    dest="speed",
+    help="Simulated seconds per real second, 0 runs as fast as possible",
+    type=float,
+    default=0,
+)
+parser.add_argument(
+    "--dataset",
+    dest="dataset",
+    help="Compressed file the DATASET output writes, defaults to <event>.log.gz",
+    type=str,
+)
+parser.add_argument(
+    "--replay",
+    dest="replay",
+    help="Stream the events in a dataset file instead of generating them",
+    type=str,
+)
 
 # sku
 sku = {
@@ -73,111 +275,841 @@ sku = {
     "Annual": {"name": "Annual", "code": "annua20", "amount": 99.99},
 }
 
+# apache log fields and their weights
+methods = {"GET": 0.6, "POST": 0.1, "DELETE": 0.1, "PUT": 0.2}
+uris = [
+    "/list",
+    "/wp-content",
+    "/wp-admin",
+    "/explore",
+    "/search/tag/list",
+    "/app/main/posts",
+    "/posts/posts/explore",
+    "/apps/cart.jsp?appID={}",
+]
+responses = {200: 0.9, 404: 0.04, 500: 0.02, 301: 0.04}
+
+# app event purchase and plan weights by treatment
+purchases = {"A": {True: 0.45, False: 0.55}, "B": {True: 0.55, False: 0.45}}
+plans = {
+    "A": {"Monthly": 0.50, "Annual": 0.50},
+    "B": {"Monthly": 0.30, "Annual": 0.70},
+}
+
+# rows generated and written at a time
+BATCH_SIZE = 10000
+# every pool holds 2**16 values, so a pool index is one unsigned short
+POOL_SIZE = 1 << 16
+
+# the traffic shape, a --traffic file overrides any of these
+traffic_defaults = {
+    # weights of each method and response
+    "methods": methods,
+    "responses": responses,
+    # a uri count of 0 is the uris above with random cart ids
+    "uris": {"count": 0, "zipf": 0},
+    "bytes": {"mean": 5000, "sigma": 50},
+    # distinct values, up to the pool size, and zipf exponent of their popularity
+    "ips": {"cardinality": POOL_SIZE, "zipf": 0},
+    "users": {"cardinality": POOL_SIZE, "zipf": 0},
+    # share of a user's events from their own session ip
+    "sessions": {"stickiness": 0},
+    # 24 hourly multipliers of the rate, by time of day
+    "diurnal": [],
+    # responses switch to these weights for seconds out of every period seconds
+    "error_bursts": {"every": 0, "seconds": 0, "responses": {500: 0.5, 200: 0.5}},
+}
+# shortest pause between streamed batches
+STREAM_TICK = 0.01
+# seconds between progress reports
+REPORT_INTERVAL = 10
+# seconds between worker counts sent to the parent
+COUNT_INTERVAL = 1
+
+
+def load_traffic(path: str = None) -> dict:
+    """ the traffic defaults, updated from a json file """
+    traffic = json.loads(json.dumps(traffic_defaults))
+    if path:
+        shape = json.loads(Path(path).read_text())
+        unknown = set(shape) - set(traffic)
+        if unknown:
+            raise SystemExit(f"Unknown traffic settings: {', '.join(sorted(unknown))}")
+        for setting, value in shape.items():
+            if isinstance(traffic[setting], dict) and setting not in (
+                "methods",
+                "responses",
+            ):
+                traffic[setting].update(value)
+            else:
+                traffic[setting] = value
+    if traffic["diurnal"] and len(traffic["diurnal"]) != 24:
+        raise SystemExit("The diurnal curve needs 24 hourly values")
+    return traffic
+
+
+def popularity(count: int, zipf: float) -> list:
+    """ weights of count values by rank, zipfian or uniform when zipf is 0 """
+    return [1 / (rank + 1) ** zipf for rank in range(count)]
+
+
+def diurnal(curve: list, when: datetime.datetime) -> float:
+    """ the rate multiplier at a time of day, between the hourly values """
+    if not curve:
+        return 1
+    hour = when.hour + when.minute / 60 + when.second / 3600
+    before, after = curve[int(hour)], curve[(int(hour) + 1) % 24]
+    return before + (after - before) * (hour - int(hour))
+
+
+def timestamp(when: datetime.datetime = None) -> str:
+    """ the apache log timestamp, in the local time zone """
+    when = when or datetime.datetime.now(local)
+    return when.strftime("%d/%b/%Y:%H:%M:%S %z")
+
+
+class EventGenerator:
+    """ generates log lines in batches, drawing from pools of pre-generated fields """
+
+    def __init__(self, seed: int = None, traffic: dict = None, trace: tuple = None):
+        self.random = random.Random(seed)
+        self.traffic = traffic or load_traffic()
+        # the run id and worker number events are traced with
+        self.trace = trace
+        self.seq = 0
+        ips, users = self.traffic["ips"], self.traffic["users"]
+        # the distinct values, drawn by popularity to fill the pools
+        self.ips = self.pool(
+            [self.ip() for _ in range(min(ips["cardinality"], POOL_SIZE))], ips["zipf"]
+        )
+        userids = [
+            str(uuid.UUID(int=self.random.getrandbits(128), version=1))
+            for _ in range(min(users["cardinality"], POOL_SIZE))
+        ]
+        # each user keeps to their own ip for a share of their events
+        home_ips = {userid: self.random.choice(self.ips) for userid in userids}
+        stickiness = self.traffic["sessions"]["stickiness"]
+        self.sessions = [
+            (userid, home_ips[userid])
+            if self.random.random() < stickiness
+            else (userid, self.random.choice(self.ips))
+            for userid in self.pool(userids, users["zipf"])
+        ]
+        # the uris, by popularity
+        self.uris = self.pool(self.uri_list(), self.traffic["uris"]["zipf"])
+        # the rest of each apache line, everything after the timestamp
+        self.requests = [
+            self.request(self.traffic["responses"]) for _ in range(POOL_SIZE)
+        ]
+        bursts = self.traffic["error_bursts"]
+        if bursts["every"]:
+            self.burst_requests = [
+                self.request(bursts["responses"]) for _ in range(POOL_SIZE)
+            ]
+        # the rest of each app event, split around the ip
+        self.app_events = [self.app_event() for _ in range(POOL_SIZE)]
+
+    def pool(self, values: list, zipf: float) -> list:
+        """ a pool of values in proportion to their popularity """
+        if not zipf:
+            # every value equally, in turn
+            return [values[index % len(values)] for index in range(POOL_SIZE)]
+        return self.random.choices(
+            values, weights=popularity(len(values), zipf), k=POOL_SIZE
+        )
+
+    def uri_list(self) -> list:
+        """ the distinct uris, the most popular first """
+        count = self.traffic["uris"]["count"]
+        if not count:
+            # one of the uris, with any cart id
+            return [
+                self.random.choice(uris).format(self.random.randint(1000, 10000))
+                for _ in range(POOL_SIZE)
+            ]
+        # the fixed uris, then as many cart ids as needed
+        carts = [uris[-1].format(1000 + index) for index in range(count)]
+        return (uris[:-1] + carts)[:count]
+
+    def choice(self, weights: dict):
+        """ one weighted draw from a dict of value: weight """
+        return self.random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def ip(self) -> str:
+        """ a random unicast ipv4 address """
+        octets = self.random.getrandbits(24).to_bytes(3, "big")
+        return f"{self.random.randint(1, 223)}.{octets[0]}.{octets[1]}.{octets[2]}"
+
+    def request(self, responses: dict) -> str:
+        """ the request, response and size of an apache log line """
+        uri = self.random.choice(self.uris)
+        size = self.traffic["bytes"]
+        byt = int(self.random.gauss(size["mean"], size["sigma"]))
+        method = self.choice(self.traffic["methods"])
+        return f'"{method} {uri} HTTP/1.0" {self.choice(responses)} {byt}'
+
+    def app_event(self) -> tuple:
+        """ the json fields of an app event before and after the ip """
+        treatment = self.random.choice(["A", "B"])
+        purchase = self.choice(purchases[treatment])
+        before = f'"treatment": "{treatment}", "purchase": {str(purchase).lower()}'
+        after = ""
+        if purchase:
+            item = sku[self.choice(plans[treatment])]
+            after = (
+                f', "item": "{item["name"]}", "amount": {item["amount"]},'
+                f' "sku": "{item["code"]}"'
+            )
+        return before, after
+
+    def sample(self, pool: list, rows: int) -> list:
+        """ draw rows values from a pool, uniformly with replacement """
+        # 16 random bits per row, read as an array of pool indexes
+        bits = self.random.getrandbits(16 * rows)
+        indexes = array("H", bits.to_bytes(2 * rows, "big"))
+        return list(map(pool.__getitem__, indexes))
+
+    def line_ends(self, rows: int, end: str, traced: str):
+        """ the end of each line, with the trace of the emit time and
+        sequence number when tracing """
+        if not self.trace:
+            return itertools.repeat(end, rows)
+        run, worker = self.trace
+        # the emit time in microseconds, an integer so no precision is lost
+        emit = time.time_ns() // 1000
+        head, tail = (
+            traced.replace("{run}", run)
+            .replace("{worker}", str(worker))
+            .replace("{emit}", str(emit))
+            .split("{seq}")
+        )
+        start, self.seq = self.seq, self.seq + rows
+        return [f"{head}{seq}{tail}" for seq in range(start, start + rows)]
+
+    def in_burst(self, when: datetime.datetime) -> bool:
+        """ whether errors are bursting at a time """
+        bursts = self.traffic["error_bursts"]
+        return bool(bursts["every"]) and (
+            when.timestamp() % bursts["every"] < bursts["seconds"]
+        )
+
+    def apachelog(self, rows: int, when: datetime.datetime = None) -> list:
+        """ a batch of apache log lines """
+        when = when or datetime.datetime.now(local)
+        dt = timestamp(when)
+        requests = self.burst_requests if self.in_burst(when) else self.requests
+        ends = self.line_ends(rows, "\n", " trace={run}/{worker}/{emit}/{seq}\n")
+        return [
+            f"{ip} - - [{dt}] {request}{end}"
+            for ip, request, end in zip(
+                self.sample(self.ips, rows), self.sample(requests, rows), ends
+            )
+        ]
+
+    def appevent(self, rows: int, when: datetime.datetime = None) -> list:
+        """ a batch of app event json lines """
+        dt = timestamp(when)
+        ends = self.line_ends(
+            rows,
+            "}\n",
+            ', "trace": {"run": "{run}", "worker": {worker}, "emit": {emit},'
+            ' "seq": {seq}}}\n',
+        )
+        return [
+            f'{{"userid": "{userid}", "timestamp": "{dt}", {before}, "ip": "{ip}"{after}{end}'
+            for (userid, ip), (before, after), end in zip(
+                self.sample(self.sessions, rows),
+                self.sample(self.app_events, rows),
+                ends,
+            )
+        ]
+
+
+def batches(source, rows: int, when: datetime.datetime = None):
+    """ yield batches of lines from the source until rows have been taken """
+    while rows > 0:
+        yield source(min(rows, BATCH_SIZE), when)
+        rows -= BATCH_SIZE
+
+
+def dataset_path(path: str, suffix: str = "") -> Path:
+    """ a worker's dataset file, the suffix goes before the extensions """
+    path = Path(path)
+    name, dot, extensions = path.name.partition(".")
+    return path.with_name(f"{name}{suffix}{dot}{extensions}")
+
+
+def dataset_workers(path: str) -> int:
+    """ the workers a dataset was written with, 0 if there is no dataset """
+    workers = 0
+    while dataset_path(path, f"-w{workers}").exists():
+        workers += 1
+    if not workers and dataset_path(path).exists():
+        return 1
+    return workers
+
+
+class DatasetReader:
+    """ reads the lines of a dataset file back, in batches """
+
+    def __init__(self, path: Path):
+        self.file = gzip.open(path, "rt", encoding="utf-8")
+
+    def __call__(self, rows: int, when: datetime.datetime = None) -> list:
+        """ the next rows lines, fewer at the end of the dataset """
+        return list(itertools.islice(self.file, rows))
+
+
+def target_rate(
+    args: argparse.Namespace, elapsed: float, when: datetime.datetime = None
+) -> float:
+    """ the events per second the load profile asks for after elapsed seconds """
+    return load_rate(args, elapsed) * diurnal(
+        args.traffic["diurnal"], when or datetime.datetime.now(local)
+    )
+
+
+def load_rate(args: argparse.Namespace, elapsed: float) -> float:
+    """ the rate of the load profile, before the time of day """
+    if args.profile == "ramp":
+        return args.rate * min(1, elapsed / args.period)
+    if args.profile == "step":
+        step = min(args.steps, 1 + int(elapsed // args.period))
+        return args.rate * step / args.steps
+    if args.profile == "spike" and elapsed % args.period >= (
+        args.period - args.spike_seconds
+    ):
+        return args.rate * args.spike
+    return args.rate
+
+
+class TokenBucket:
+    """ paces events to a rate, bursting up to a second of saved up tokens """
+
+    def __init__(self):
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, limit: int) -> int:
+        """ take up to limit tokens at the current rate, none if a batch isn't due """
+        now = time.monotonic()
+        self.tokens = min(max(rate, 1), self.tokens + rate * (now - self.updated))
+        self.updated = now
+        # wait for at least a tick worth of events, to write in batches
+        wanted = max(1, rate * STREAM_TICK)
+        if self.tokens < wanted:
+            # the rate may change, so don't wait longer than a tick
+            time.sleep(min(STREAM_TICK, (wanted - self.tokens) / max(rate, 1)))
+            return 0
+        taken = min(int(self.tokens), limit)
+        self.tokens -= taken
+        return taken
+
+
+def log_filename(directory: Path, suffix: str = "") -> Path:
+    """ a new log file name, timestamped, with a counter if that is taken """
+    timestr = time.strftime("%Y%m%d-%H%M%S")
+    filename = directory.joinpath(f"access_log_{timestr}{suffix}.log")
+    counter = 0
+    while filename.exists():
+        counter += 1
+        filename = directory.joinpath(f"access_log_{timestr}{suffix}-{counter}.log")
+    return filename
+
+
+class RotatingLog:
+    """ appends lines to a log file, starting a new file by size or age """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        max_seconds: float,
+        keep: int,
+        suffix: str = "",
+    ):
+        self.directory = Path(directory)
+        self.suffix = suffix
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.keep = keep
+        self.written = []
+        self.file = None
+
+    def rotate(self):
+        """ close the current file and open the next one """
+        self.close()
+        filename = log_filename(self.directory, self.suffix)
+        self.file = open(filename, "a", encoding="utf-8", buffering=1 << 20)
+        self.name = str(filename)
+        self.size = 0
+        self.opened = time.monotonic()
+        self.written.append(filename)
+        # remove the oldest files, filebeat has long finished with them
+        while self.keep and len(self.written) > self.keep:
+            self.written.pop(0).unlink()
+
+    def write(self, lines: list) -> int:
+        """ append lines, flushed so filebeat sees them straight away """
+        if (
+            self.file is None
+            or (self.max_bytes and self.size >= self.max_bytes)
+            or (
+                self.max_seconds
+                and time.monotonic() - self.opened >= self.max_seconds
+            )
+        ):
+            self.rotate()
+        self.file.writelines(lines)
+        self.file.flush()
+        written = sum(map(len, lines))
+        self.size += written
+        return written
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class ConsoleLog:
+    """ writes lines to stdout """
+
+    name = "stdout"
+
+    def rotate(self):
+        pass
+
+    def write(self, lines: list) -> int:
+        sys.stdout.writelines(lines)
+        sys.stdout.flush()
+        return sum(map(len, lines))
+
+    def close(self):
+        pass
+
+
+class Latencies:
+    """ delivery latencies counted in buckets 5% apart, percentiles in fixed memory """
+
+    base = 1.05
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+
+    def add(self, seconds: float):
+        self.buckets[int(math.log(max(seconds, 1e-6) * 1e6, self.base))] += 1
+        self.count += 1
+
+    def percentile(self, percent: float) -> float:
+        """ the latency in ms that percent of deliveries were within """
+        wanted = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return self.base ** (bucket + 1) / 1000
+        return 0.0
+
+
+class KafkaLog:
+    """ publishes lines to a kafka topic through an asynchronous batching producer """
+
+    def __init__(self, args: argparse.Namespace, suffix: str = ""):
+        if not args.brokers:
+            raise SystemExit("Kafka output needs --brokers or $KAFKA_BROKERS")
+        # only needed for this output
+        try:
+            from confluent_kafka import Producer
+        except ImportError:
+            raise SystemExit("Kafka output needs confluent-kafka installed")
+        self.topic = args.topic or args.event_type
+        self.name = f"kafka topic {self.topic}{suffix}"
+        self.producer = Producer(
+            {
+                "bootstrap.servers": args.brokers,
+                "linger.ms": args.linger_ms,
+                "batch.size": args.batch_kb * 1024,
+                "compression.type": args.compression,
+                "acks": args.acks,
+            }
+        )
+        self.latencies = Latencies()
+        self.failed = 0
+        self.start = self.reported = time.monotonic()
+        self.reported_count = 0
+
+    def delivered(self, sent: float, err, msg):
+        """ delivery callback, err is set if the message was not delivered """
+        if err is not None:
+            self.failed += 1
+        else:
+            self.latencies.add(time.monotonic() - sent)
+
+    def rotate(self):
+        pass
+
+    def write(self, lines: list) -> int:
+        """ queue the lines for the producer to batch, serving delivery callbacks """
+        produce = self.producer.produce
+        for number, line in enumerate(lines):
+            # latency is timed from when each thousand lines were queued
+            if not number % 1000:
+                on_delivery = partial(self.delivered, time.monotonic())
+            while True:
+                try:
+                    produce(self.topic, line[:-1], on_delivery=on_delivery)
+                    break
+                except BufferError:
+                    # the local queue is full, wait for deliveries to make room
+                    self.producer.poll(0.1)
+        self.producer.poll(0)
+        if time.monotonic() - self.reported >= REPORT_INTERVAL:
+            self.report()
+        return sum(map(len, lines))
+
+    def report(self):
+        """ producer throughput and delivery latencies, since the last report """
+        now = time.monotonic()
+        delivered = self.latencies.count - self.reported_count
+        print(
+            f"{self.name}: {delivered / (now - self.reported):,.0f} delivered/s,"
+            f" {self.failed:,} failed, latency ms"
+            f" p50 {self.latencies.percentile(50):,.1f}"
+            f" p95 {self.latencies.percentile(95):,.1f}"
+            f" p99 {self.latencies.percentile(99):,.1f}",
+            file=sys.stderr,
+        )
+        self.reported, self.reported_count = now, self.latencies.count
+
+    def close(self):
+        """ wait for outstanding deliveries, then report on them all """
+        undelivered = self.producer.flush(30)
+        self.reported, self.reported_count = self.start, 0
+        self.report()
+        if undelivered:
+            print(f"{self.name}: {undelivered:,} undelivered", file=sys.stderr)
+
+
+class DatasetLog:
+    """ writes lines to a gzip compressed dataset file, for replaying later """
+
+    def __init__(self, path: Path):
+        self.name = str(path)
+        # no time in the gzip header, so the same events make the same file,
+        # the fastest level still compresses log lines several times over
+        self.file = gzip.GzipFile(path, "wb", compresslevel=1, mtime=0)
+
+    def rotate(self):
+        pass
+
+    def write(self, lines: list) -> int:
+        data = "".join(lines).encode("utf-8")
+        self.file.write(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+
+
+def open_log(args: argparse.Namespace, suffix: str = "", rotating: bool = True):
+    """ the output events are written to """
+    if args.output_type == "KAFKA":
+        return KafkaLog(args, suffix)
+    if args.output_type == "CONSOLE":
+        return ConsoleLog()
+    if args.output_type == "DATASET":
+        return DatasetLog(
+            dataset_path(args.dataset or f"{args.event_type}.log.gz", suffix)
+        )
+    if not rotating:
+        # files are started explicitly
+        return RotatingLog(args.event_type, 0, 0, 0, suffix)
+    return RotatingLog(
+        args.event_type,
+        int(args.rotate_mb * 1024 * 1024),
+        args.rotate_seconds,
+        args.keep,
+        suffix,
+    )
+
+
+def stop(signum, frame):
+    """ stop generating on a terminate, as on control+c """
+    # only the first signal stops, any more would interrupt the clean up
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+class Reporter:
+    """ totals the events and bytes written, printing rates to stderr """
+
+    def __init__(self):
+        self.start = self.reported = time.monotonic()
+        self.events = self.bytes = 0
+        self.reported_events = self.reported_bytes = 0
+
+    def add(self, events: int, written: int):
+        self.events += events
+        self.bytes += written
+        now = time.monotonic()
+        if now - self.reported >= REPORT_INTERVAL:
+            elapsed = now - self.reported
+            events = self.events - self.reported_events
+            megabytes = (self.bytes - self.reported_bytes) / 1024 / 1024
+            print(
+                f"{events / elapsed:,.0f} events/s, {megabytes / elapsed:,.1f} MB/s",
+                file=sys.stderr,
+            )
+            self.reported = now
+            self.reported_events, self.reported_bytes = self.events, self.bytes
+
+    def summary(self):
+        elapsed = time.monotonic() - self.start
+        megabytes = self.bytes / 1024 / 1024
+        print(
+            f"{self.events:,} events, {megabytes:,.1f} MB in {elapsed:,.1f}s:"
+            f" {self.events / elapsed:,.0f} events/s, {megabytes / elapsed:,.1f} MB/s",
+            file=sys.stderr,
+        )
+
+
+class Counter:
+    """ counts what a worker writes, sending the counts on to the parent """
+
+    def __init__(self, counts: multiprocessing.Queue):
+        self.counts = counts
+        self.sent = time.monotonic()
+        self.events = self.bytes = 0
+
+    def add(self, events: int, written: int):
+        self.events += events
+        self.bytes += written
+        if time.monotonic() - self.sent >= COUNT_INTERVAL:
+            self.send()
+
+    def send(self):
+        self.counts.put((self.events, self.bytes))
+        self.sent = time.monotonic()
+        self.events = self.bytes = 0
+
+
+def stream(args: argparse.Namespace, source, counter, suffix: str = ""):
+    """ write events at the profile rate until stopped or the source runs out """
+    log = open_log(args, suffix)
+    bucket = TokenBucket()
+    start = time.monotonic()
+    try:
+        while not args.duration or time.monotonic() - start < args.duration:
+            rate = target_rate(args, time.monotonic() - start)
+            # a rate of 0 isn't paced
+            rows = bucket.take(rate, BATCH_SIZE) if args.rate > 0 else BATCH_SIZE
+            if rows:
+                lines = source(rows)
+                if not lines:
+                    break
+                counter.add(len(lines), log.write(lines))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
+
+
+def history(args: argparse.Namespace, source, counter, suffix: str = ""):
+    """ write the events from start to end, a simulated second at a time """
+    log = open_log(args, suffix)
+    seconds = int((args.end - args.start).total_seconds())
+    began = time.monotonic()
+    owed = 0.0
+    # a simulated second can be only a few events, write them in batches
+    pending = []
+
+    def write_pending():
+        if pending:
+            counter.add(len(pending), log.write(pending))
+            pending.clear()
+
+    try:
+        for elapsed in range(seconds):
+            # the profile rate in simulated time, carrying part events over
+            when = args.start + datetime.timedelta(seconds=elapsed)
+            owed += target_rate(args, elapsed, when)
+            rows = int(owed)
+            owed -= rows
+            for lines in batches(source, rows, when):
+                pending.extend(lines)
+            if len(pending) >= BATCH_SIZE:
+                write_pending()
+            # at a set speed, wait for real time to catch up
+            if args.speed:
+                ahead = began + (elapsed + 1) / args.speed - time.monotonic()
+                if ahead > 0:
+                    write_pending()
+                    time.sleep(ahead)
+        write_pending()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
+
+
+def write_files(args: argparse.Namespace, source, counter, suffix: str = ""):
+    """ write whole files of events, waiting between them """
+    log = open_log(args, suffix, rotating=False)
+    try:
+        # how many files
+        for fls in range(args.files_number):
+            start = time.perf_counter()
+            log.rotate()
+            for lines in batches(source, args.row_number):
+                counter.add(len(lines), log.write(lines))
+            if args.output_type != "CONSOLE":
+                rate = args.row_number / (time.perf_counter() - start)
+                print(fls + 1, log.name, f"{rate:,.0f} events/s")
+
+            if fls != args.files_number - 1:
+                time.sleep(args.interval)
+    finally:
+        log.close()
+
+
+def generate(
+    args: argparse.Namespace, seed: int, counter, suffix: str = "", number: int = 0
+):
+    """ generate or replay events, streaming or writing files depending on the args """
+    if args.replay:
+        source = DatasetReader(dataset_path(args.replay, suffix))
+    else:
+        trace = (args.trace_run, number) if args.trace else None
+        generator = EventGenerator(seed, args.traffic, trace)
+        source = getattr(generator, args.event_type)
+    if args.start:
+        history(args, source, counter, suffix)
+    elif args.stream or args.replay:
+        stream(args, source, counter, suffix)
+    else:
+        write_files(args, source, counter, suffix)
+
+
+def worker(args: argparse.Namespace, number: int, seed: int, counts):
+    """ generate this worker's share of the events into its own files """
+    # the parent passes control+c on as a terminate
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stop)
+    # each worker takes an equal share of the rows and the rate
+    args.row_number = args.row_number // args.workers + (
+        number < args.row_number % args.workers
+    )
+    args.rate = args.rate / args.workers
+    counter = Counter(counts)
+    try:
+        generate(args, seed, counter, f"-w{number}", number)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        counter.send()
+
+
+def run_workers(args: argparse.Namespace, seed: int):
+    """ run the workers, totalling their counts until they have all finished """
+    counts = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=worker, args=(args, number, seed + number, counts)
+        )
+        for number in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    reporter = Reporter()
+    interrupted = False
+    try:
+        while any(process.is_alive() for process in processes) or not counts.empty():
+            try:
+                reporter.add(*counts.get(timeout=COUNT_INTERVAL))
+            except queue.Empty:
+                pass
+    except KeyboardInterrupt:
+        # stop the workers, then collect their final counts
+        interrupted = True
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        while not counts.empty():
+            reporter.add(*counts.get())
+    for process in processes:
+        process.join()
+    reporter.summary()
+    # the totals are short of the events of any worker that failed
+    failed = [
+        f"worker {number} exited with {process.exitcode}"
+        for number, process in enumerate(processes)
+        if process.exitcode
+    ]
+    if failed and not interrupted:
+        print(", ".join(failed), file=sys.stderr)
+        sys.exit(1)
+
 
 def main():
 
-    # how many files
-    for fls in range(args.files_number):
-        # string for the output
-        eventrows = ""
-        timestr = time.strftime("%Y%m%d-%H%M%S")
-        otime = datetime.datetime.now()
-
-        # write 10 lines
-        for ln in range(args.row_number):
-            # set the ip
-            ip = faker.ipv4()
-            # set the timestamp
-            dt = otime.strftime("%d/%b/%Y:%H:%M:%S")
-            # set the time zone
-            tz = datetime.datetime.now(local).strftime("%z")
-            # get the method
-            method = random.choices(
-                population=["GET", "POST", "DELETE", "PUT"],
-                weights=[0.6, 0.1, 0.1, 0.2],
-            )[0]
-            # generate the uri
-            uri = random.choice(
-                [
-                    "/list",
-                    "/wp-content",
-                    "/wp-admin",
-                    "/explore",
-                    "/search/tag/list",
-                    "/app/main/posts",
-                    "/posts/posts/explore",
-                    f"/apps/cart.jsp?appID={str(random.randint(1000, 10000))}",
-                ]
+    # read the args
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("Minimum number of workers is 1")
+    if args.workers > 1 and args.output_type == "CONSOLE":
+        parser.error("Only one worker can write to the console")
+    if args.replay and args.start:
+        parser.error("A replay keeps the dataset timestamps, it can't have a start")
+    if args.period <= 0:
+        parser.error("The --period must be positive")
+    if args.steps < 1:
+        parser.error("Minimum number of --steps is 1")
+    if args.profile == "spike" and not 0 < args.spike_seconds <= args.period:
+        parser.error("The --spike-seconds must be positive and at most the --period")
+    if args.replay:
+        # each worker replays the file it wrote
+        suffixes = [f"-w{number}" for number in range(args.workers)]
+        if args.workers == 1:
+            suffixes = [""]
+        if not all(dataset_path(args.replay, s).exists() for s in suffixes):
+            workers = dataset_workers(args.replay)
+            if not workers:
+                parser.error(f"No dataset to replay at {args.replay}")
+            parser.error(
+                f"The dataset was written by {workers} workers,"
+                f" replay it with --workers {workers}"
             )
-            # generate a response
-            response = random.choices(
-                population=[200, 404, 500, 301], weights=[0.9, 0.04, 0.02, 0.04]
-            )[0]
-            # generate the byte size
-            byt = int(random.gauss(5000, 50))
-            # userid
-            userid = str(uuid.uuid1())
-            # treatment
-            treatment = random.choice(["A", "B"])
-            # purchase
-            if treatment == "A":
-                purchase = random.choices(
-                    population=[True, False], weights=[0.45, 0.55]
-                )
-            else:
-                purchase = random.choices(
-                    population=[True, False], weights=[0.55, 0.45]
-                )
-            if treatment == "A":
-                item = sku[
-                    random.choices(
-                        population=["Monthly", "Annual"], weights=[0.50, 0.50]
-                    )[0]
-                ]
-            else:
-                item = sku[
-                    random.choices(
-                        population=["Monthly", "Annual"], weights=[0.30, 0.70]
-                    )[0]
-                ]
-            # add the apache log record to the event
-            if args.event_type == "apachelog":
-                eventrows += (
-                    f'{ip} - - [{dt} {tz}] "{method} {uri} HTTP/1.0" {response} {byt}\n'
-                )
-            # add the appevent record
-            elif args.event_type == "appevent":
-                this_event = {
-                    "userid": userid,
-                    "timestamp": f"{dt} {tz}",
-                    "treatment": treatment,
-                    "purchase": purchase[0],
-                    "ip": ip,
-                }
-                if purchase[0] == True:
-                    this_event["item"] = item["name"]
-                    this_event["amount"] = item["amount"]
-                    this_event["sku"] = item["code"]
-                eventrows += f"{json.dumps(this_event, ensure_ascii=False)}\n"
-
-        # write out the file
-        if args.output_type == "LOG":
-            filename = f"{args.event_type}/access_log_{timestr}.log"
-            print(fls+1, filename)
-            Path(args.event_type).mkdir(parents=True, exist_ok=True)
-            # write out the files
-            with open(filename, "w", encoding="utf-8") as f:
-                f.write(eventrows)
-        # print to the console
-        elif args.output_type == "CONSOLE":
-            print(filename)
-            if args.event_type == "apachelog":
-                print(eventrows)
-            elif args.event_type == "appevent":
-                print(json.dumps(eventrows, ensure_ascii=False, indent=4))
-
-        if fls != args.files_number-1:
-            time.sleep(30)
+    if args.start:
+        args.end = args.end or datetime.datetime.now(datetime.timezone.utc)
+    args.traffic = load_traffic(args.traffic)
+    if args.trace:
+        # a new id every run, so runs with the same seed can be told apart
+        args.trace_run = f"{random.SystemRandom().getrandbits(32):08x}"
+        print(f"trace run {args.trace_run}", file=sys.stderr)
+    signal.signal(signal.SIGTERM, stop)
+
+    # worker seeds follow on from the base seed, so a run can be repeated
+    seed = args.seed
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(32)
+    if args.workers > 1:
+        print(f"{args.workers} workers, seeds from {seed}", file=sys.stderr)
+        run_workers(args, seed)
+        return
+
+    print(f"seed {seed}", file=sys.stderr)
+    reporter = Reporter()
+    try:
+        generate(args, seed, reporter)
+    except KeyboardInterrupt:
+        pass
+    reporter.summary()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+# get modules
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+
+# initiate the parse
+parser = argparse.ArgumentParser(
+    description="Compare filebeat kafka output profiles on the same log generator events"
+)
+parser.add_argument(
+    "-p",
+    "--profile",
+    dest="profiles",
+    help="Kafka output profile to run, can be repeated, defaults to all of them",
+    type=str,
+    action="append",
+)
+parser.add_argument(
+    "--profiles-file",
+    dest="profiles_file",
+    help="Json file of the profiles, defaults to kafka_profiles.json next to this"
+    " script or FILEBEAT_KAFKA_PROFILES in helpers/constants.py",
+    type=str,
+    default=os.path.join(dirname, "kafka_profiles.json"),
+)
+parser.add_argument(
+    "-e",
+    "--event",
+    dest="event_type",
+    help="Logged event type",
+    type=str,
+    choices=["apachelog", "appevent"],
+    default="apachelog",
+)
+parser.add_argument(
+    "-r",
+    "--rows",
+    dest="rows",
+    help="Number of events to publish with each profile",
+    type=int,
+    default=1000000,
+)
+parser.add_argument(
+    "--brokers",
+    dest="brokers",
+    help="Kafka bootstrap brokers, defaults to $KAFKA_BROKERS",
+    type=str,
+    default=os.environ.get("KAFKA_BROKERS", ""),
+)
+parser.add_argument(
+    "--filebeat",
+    dest="filebeat",
+    help="Path of the filebeat executable",
+    type=str,
+    default="/usr/share/filebeat/bin/filebeat",
+)
+parser.add_argument(
+    "--kafka-bin",
+    dest="kafka_bin",
+    help="Kafka bin directory with kafka-log-dirs.sh, to measure bytes on disk",
+    type=str,
+    default="/opt/kafka_2.12-2.4.0/bin",
+)
+parser.add_argument(
+    "--port",
+    dest="port",
+    help="Port of the filebeat http stats endpoint",
+    type=int,
+    default=5067,
+)
+parser.add_argument(
+    "--seed",
+    dest="seed",
+    help="Seed of the log generator, for the same events each run",
+    type=int,
+    default=1,
+)
+
+# seconds to wait for filebeat to publish the events
+PUBLISH_TIMEOUT = 900
+# seconds between polls of the stats endpoint
+POLL_INTERVAL = 0.5
+
+
+def load_profiles(path: str) -> dict:
+    """ the kafka output profiles, from the json the stack writes or the constants """
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    sys.path.insert(0, os.path.join(dirname, ".."))
+    from helpers.constants import constants
+
+    return constants["FILEBEAT_KAFKA_PROFILES"]
+
+
+def yaml_settings(settings: dict, indent: int = 0) -> str:
+    """ flat yaml settings, one per line """
+    lines = []
+    for key, value in settings.items():
+        if isinstance(value, bool):
+            value = str(value).lower()
+        lines.append(f"{key}: {value}")
+    return f"\n{' ' * indent}".join(lines)
+
+
+def filebeat_yml(args: argparse.Namespace, work_dir: str, topic: str, profile: dict):
+    """ a filebeat.yml shipping the benchmark log to a topic with a profile """
+    hosts = ", ".join(f'"{broker}"' for broker in args.brokers.split(","))
+    return "\n".join(
+        [
+            "filebeat.inputs:",
+            "- type: filestream",
+            "  id: bench",
+            "  paths:",
+            f"    - {work_dir}/log/*.log",
+            "output.kafka:",
+            f"  hosts: [ {hosts} ]",
+            f"  topic: {topic}",
+            f"  {yaml_settings(profile, indent=2)}" if profile else "",
+            "http.enabled: true",
+            "http.host: localhost",
+            f"http.port: {args.port}",
+            "logging.level: warning",
+            "",
+        ]
+    )
+
+
+def generate_log(args: argparse.Namespace, path: str):
+    """ write the benchmark events with the log generator """
+    with open(path, "w") as log:
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(dirname, "log_generator.py"),
+                "-o",
+                "CONSOLE",
+                "-e",
+                args.event_type,
+                "-r",
+                str(args.rows),
+                "-i",
+                "0",
+                "--seed",
+                str(args.seed),
+            ],
+            stdout=log,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+
+
+def beat_stats(port: int) -> dict:
+    """ the libbeat stats of the running filebeat, None until it serves them """
+    try:
+        with urllib.request.urlopen(
+            f"http://localhost:{port}/stats", timeout=5
+        ) as response:
+            return json.loads(response.read())["libbeat"]
+    except (urllib.error.URLError, ConnectionError, ValueError, KeyError):
+        return None
+
+
+def topic_bytes(args: argparse.Namespace, topic: str) -> int:
+    """ bytes of a topic on the broker disks, all replicas, None without the
+    kafka tools """
+    tool = os.path.join(args.kafka_bin, "kafka-log-dirs.sh")
+    if not os.path.exists(tool):
+        return None
+    result = subprocess.run(
+        [
+            tool,
+            "--bootstrap-server",
+            args.brokers,
+            "--describe",
+            "--topic-list",
+            topic,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+    # the description is the json line of the output
+    for line in result.stdout.splitlines():
+        if line.startswith("{"):
+            description = json.loads(line)
+            return sum(
+                partition["size"]
+                for broker in description["brokers"]
+                for log_dir in broker["logDirs"]
+                for partition in log_dir["partitions"]
+            )
+    return 0
+
+
+def benchmark(args: argparse.Namespace, log_path: str, name: str, profile: dict):
+    """ publish the log with a profile, return the events/s, bytes written to
+    kafka and bytes added on the broker disks """
+    topic = f"elkk-bench-{name}"
+    disk_before = topic_bytes(args, topic)
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.mkdir(os.path.join(work_dir, "log"))
+        os.link(log_path, os.path.join(work_dir, "log", "bench.log"))
+        config = os.path.join(work_dir, "filebeat.yml")
+        with open(config, "w") as f:
+            f.write(filebeat_yml(args, work_dir, topic, profile))
+        os.chmod(config, 0o600)
+        process = subprocess.Popen(
+            [
+                args.filebeat,
+                "-c",
+                config,
+                "--path.home",
+                os.path.dirname(os.path.dirname(args.filebeat)),
+                "--path.data",
+                os.path.join(work_dir, "data"),
+                "--path.logs",
+                os.path.join(work_dir, "logs"),
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            # time from the first event published to the last one acked
+            started = None
+            deadline = time.time() + PUBLISH_TIMEOUT
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"filebeat exited with {process.returncode}")
+                if time.time() > deadline:
+                    raise RuntimeError(f"timed out publishing with {name}")
+                stats = beat_stats(args.port)
+                if stats:
+                    published = stats["pipeline"]["events"]["published"]
+                    if started is None and published:
+                        started = time.perf_counter()
+                    if stats["output"]["events"]["acked"] >= args.rows:
+                        elapsed = time.perf_counter() - started
+                        break
+                time.sleep(POLL_INTERVAL)
+        finally:
+            process.terminate()
+            process.wait()
+    disk_after = topic_bytes(args, topic)
+    return {
+        "events_per_second": args.rows / elapsed,
+        "failed": stats["output"]["events"]["failed"],
+        "write_bytes": stats["output"]["write"]["bytes"],
+        "disk_bytes": None if disk_after is None else disk_after - disk_before,
+    }
+
+
+def main():
+    args = parser.parse_args()
+    if not args.brokers:
+        parser.error("Needs the kafka --brokers, or $KAFKA_BROKERS")
+    profiles = load_profiles(args.profiles_file)
+    names = args.profiles or list(profiles)
+    unknown = [name for name in names if name not in profiles]
+    if unknown:
+        parser.error(f"Unknown profiles {unknown}, choose from {list(profiles)}")
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        # the same events for every profile
+        log_path = os.path.join(log_dir, "bench.log")
+        generate_log(args, log_path)
+        log_bytes = os.path.getsize(log_path)
+        print(
+            f"{args.rows:,} {args.event_type} events, {log_bytes / 1e6:,.1f} MB of log"
+        )
+        print(
+            f"  {'profile':16} {'events/s':>10} {'failed':>8}"
+            f" {'to kafka MB':>12} {'on disk MB':>11}"
+        )
+        for name in names:
+            result = benchmark(args, log_path, name, profiles[name])
+            disk = (
+                "n/a"
+                if result["disk_bytes"] is None
+                else f"{result['disk_bytes'] / 1e6:,.1f}"
+            )
+            print(
+                f"  {name:16} {result['events_per_second']:10,.0f}"
+                f" {result['failed']:8,} {result['write_bytes'] / 1e6:12,.1f}"
+                f" {disk:>11}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,105 @@ constants = {
     "PROJECT_TAG": "elkk-stack",
     # do not include the .pem in the keypair name
     "KEY_PAIR": "elk-key-pair",
+    # seconds to reuse the cached discovery of existing resources
+    "DISCOVERY_CACHE_TTL": 3600,
+    # seconds to wait for ident.me when the public ip is not set
+    "EXTERNAL_IP_TIMEOUT": 5,
     # Kafka settings
     "KAFKA_DOWNLOAD_VERSION": "kafka_2.12-2.4.0",
     "KAFKA_BROKER_NODES": 3,
     "KAFKA_VERSION": "2.3.1",
     "KAFKA_INSTANCE_TYPE": "kafka.m5.large",
     "KAFKA_CLIENT_INSTANCE": "t2.xlarge",
+    # broker profile for ingest, a new msk configuration revision when changed
+    "KAFKA_BROKER_PROPERTIES": {
+        "auto.create.topics.enable": True,
+        "default.replication.factor": 3,
+        "num.partitions": 3,
+        "min.insync.replicas": 2,
+        # threads for requests from disk, from the network and to follow leaders
+        "num.io.threads": 8,
+        "num.network.threads": 5,
+        "num.replica.fetchers": 2,
+        # larger socket buffers for batched producers and fetches
+        "socket.send.buffer.bytes": 1048576,
+        "socket.receive.buffer.bytes": 1048576,
+        "socket.request.max.bytes": 104857600,
+        "log.segment.bytes": 1073741824,
+        # keep the producer's compression rather than recompressing
+        "compression.type": "producer",
+    },
+    # topics and the MB/s expected into each, partitions are planned from it and
+    # from the logstash consumer threads reading the topic, unless set as partitions
+    "KAFKA_TOPICS": {
+        "elkktopic": {"target_mbps": 1},
+        "apachelog": {"target_mbps": 20},
+        "appevent": {"target_mbps": 10},
+    },
+    # MB/s a single partition is planned to take
+    "KAFKA_PARTITION_MBPS": 5,
+    "KAFKA_REPLICATION_FACTOR": 3,
     # Filebeat
     "FILEBEAT_INSTANCE": "t2.xlarge",
+    # filestream input settings for directories of short lived generator files
+    "FILEBEAT_FILESTREAM": {
+        # scan for new files every
+        "prospector.scanner.check_interval": "1s",
+        # close a file after no new lines for, or once it is removed
+        "close.on_state_change.inactive": "1m",
+        "close.on_state_change.removed": True,
+        # open at most this many files per input at once
+        "harvester_limit": 64,
+        # drop the registry state of removed files, and of files not changed
+        # for clean_inactive, which must be more than ignore_older and the scan
+        "ignore_older": "2h",
+        "clean_inactive": "3h",
+        "clean_removed": True,
+    },
+    # memory queue between the inputs and the kafka output, at least worker times
+    # bulk_max_size events, or e.g. "queue.disk.max_size": "10GB" to spool to disk
+    "FILEBEAT_QUEUE": {
+        "queue.mem.events": 65536,
+        "queue.mem.flush.min_events": 2048,
+        "queue.mem.flush.timeout": "1s",
+    },
+    # local http endpoint for the harvester, queue and output metrics
+    "FILEBEAT_HTTP_PORT": 5066,
+    # kafka output profile rendered into filebeat.yml
+    "FILEBEAT_KAFKA_PROFILE": "lz4",
+    # kafka output profiles, compared by filebeat/producer_benchmark.py
+    "FILEBEAT_KAFKA_PROFILES": {
+        # the filebeat defaults
+        "default": {},
+        # large compressed batches, acked by the leader
+        "lz4": {
+            "compression": "lz4",
+            "bulk_max_size": 4096,
+            "worker": 2,
+            "channel_buffer_size": 1024,
+            "keep_alive": "60s",
+            "required_acks": 1,
+        },
+        # smaller on the wire and on disk, for more cpu
+        "gzip": {
+            "compression": "gzip",
+            "compression_level": 4,
+            "bulk_max_size": 4096,
+            "worker": 2,
+            "channel_buffer_size": 1024,
+            "keep_alive": "60s",
+            "required_acks": 1,
+        },
+        # acked by all in sync replicas
+        "lz4_all_acks": {
+            "compression": "lz4",
+            "bulk_max_size": 4096,
+            "worker": 4,
+            "channel_buffer_size": 1024,
+            "keep_alive": "60s",
+            "required_acks": -1,
+        },
+    },
     # Elastic
     "ELASTIC_CLIENT_INSTANCE": "t2.xlarge",
     "ELASTIC_DEDICATED_MASTER": False,
@@ -19,7 +110,56 @@ constants = {
     "ELASTIC_INSTANCE_COUNT": 3,
     "ELASTIC_INSTANCE": "r5.large.elasticsearch",
     "ELASTIC_VERSION": "7.1",
+    # Kibana proxy lambda tuning
+    "KIBANA_LAMBDA_ENV": {
+        "POOL_SIZE": 10,
+        "RETRY_TOTAL": 3,
+        "RETRY_BACKOFF": 0.2,
+        "CONNECT_TIMEOUT": 3.05,
+        "READ_TIMEOUT": 60,
+        "RESPONSE_CACHE_MAX_BYTES": 16 * 1024 * 1024,
+        "BATCH_MAX_REQUESTS": 50,
+    },
+    # concurrent asset fetches when warming the kibana cache
+    "KIBANA_CACHE_WARM_CONCURRENCY": 8,
     # Logstash
     "LOGSTASH_INSTANCE": "t2.xlarge",
+    # fargate tasks, scaled on cpu
+    "LOGSTASH_FARGATE_MIN_CAPACITY": 3,
+    "LOGSTASH_FARGATE_MAX_CAPACITY": 10,
+    # and on the kafka consumer lag, in messages, cpu only scales them out
+    "LOGSTASH_LAG_NAMESPACE": "elkk/logstash",
+    "LOGSTASH_LAG_SCALING": {
+        # tasks added as the lag passes each step
+        "out": [{"lower": 10000, "change": 1}, {"lower": 100000, "change": 3}],
+        # a task removed once the lag stays under upper for the minutes
+        "in": {"upper": 1000, "change": -1, "minutes": 5},
+    },
+    # pipeline conf, logstash.conf or the single pass logstash_optimized.conf
+    "LOGSTASH_CONF": "logstash.conf",
+    # topics no pipeline reads, the filebeat producer benchmark's
+    "LOGSTASH_IGNORED_TOPICS": ["elkk-bench-.*"],
+    # a pipeline each, so a slow topic doesn't hold up the others
+    # an empty topics_pattern takes the topics of no other pipeline, e.g. elkktopic
+    "LOGSTASH_PIPELINES": {
+        "apachelog": {
+            "topics_pattern": "apachelog",
+            "workers": 2,
+            "batch_size": 500,
+            "consumer_threads": 2,
+        },
+        "appevent": {
+            "topics_pattern": "appevent",
+            "workers": 1,
+            "batch_size": 250,
+            "consumer_threads": 1,
+        },
+        "other": {
+            "topics_pattern": "",
+            "workers": 1,
+            "batch_size": 125,
+            "consumer_threads": 1,
+        },
+    },
 }
 
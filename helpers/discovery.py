@@ -0,0 +1,164 @@
+# modules
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from botocore.exceptions import ClientError
+from helpers.constants import constants
+
+# discovery results are cached here between synths
+CACHE_FILE = Path(os.path.dirname(__file__)).parent.joinpath(".elkk_discovery.json")
+
+# resource types to find with the project tag
+RESOURCE_TYPES = ["kafka", "es", "s3", "ec2:security-group"]
+
+# in process copy of the discovery
+_discovered = {}
+_discovered_lock = threading.Lock()
+
+
+def empty_discovery() -> dict:
+    """ the resources the stacks need, blank until found """
+    return {
+        "kafka_arn": "",
+        "kafka_brokers": "",
+        "elastic_domain": "",
+        "elastic_endpoint": "",
+        "athena_bucket": "",
+        "kibana_bucket": "",
+        "kafka_security_group": "",
+        "elastic_security_group": "",
+    }
+
+
+def cache_scope() -> str:
+    """ discovery is only valid for the same account and region """
+    return f'{os.environ.get("CDK_DEFAULT_ACCOUNT", "")}/{os.environ.get("CDK_DEFAULT_REGION", "")}'
+
+
+def read_cache() -> dict:
+    """ read the cached discovery if it is current and complete """
+    try:
+        cached = json.loads(CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+    if cached.get("scope") != cache_scope():
+        return {}
+    if time.time() - cached.get("timestamp", 0) > constants["DISCOVERY_CACHE_TTL"]:
+        return {}
+    # a partial discovery means stacks are still being deployed, look again
+    if not all(cached.get("resources", {}).values()):
+        return {}
+    return cached["resources"]
+
+
+def write_cache(resources: dict):
+    """ save the discovery to disk """
+    try:
+        CACHE_FILE.write_text(
+            json.dumps(
+                {"scope": cache_scope(), "timestamp": time.time(), "resources": resources},
+                indent=4,
+            )
+        )
+    except OSError as err:
+        print(f"Unable to write discovery cache: {err}")
+
+
+def tagged_resources() -> list:
+    """ get every resource with the project tag in a single paginated lookup """
+    tagging_client = boto3.session.Session().client("resourcegroupstaggingapi")
+    paginator = tagging_client.get_paginator("get_resources")
+    resources = []
+    for page in paginator.paginate(
+        TagFilters=[{"Key": "project", "Values": [constants["PROJECT_TAG"]]}],
+        ResourceTypeFilters=RESOURCE_TYPES,
+    ):
+        resources.extend(page["ResourceTagMappingList"])
+    return resources
+
+
+def classify_resources(resources: list) -> dict:
+    """ map the tagged resources to what the stacks need """
+    discovered = empty_discovery()
+    for resource in resources:
+        arn = resource["ResourceARN"]
+        tags = {tag["Key"]: tag["Value"] for tag in resource.get("Tags", [])}
+        service, resource_id = arn.split(":")[2], arn.split(":")[-1]
+        if service == "kafka" and resource_id.startswith("cluster/"):
+            discovered["kafka_arn"] = arn
+        elif service == "es" and resource_id.startswith("domain/"):
+            discovered["elastic_domain"] = resource_id.split("/", 1)[1]
+        elif service == "s3":
+            stack_name = tags.get("aws:cloudformation:stack-name")
+            if stack_name == "elkk-athena":
+                discovered["athena_bucket"] = resource_id
+            elif stack_name == "elkk-kibana":
+                discovered["kibana_bucket"] = resource_id
+        elif service == "ec2" and resource_id.startswith("security-group/"):
+            if tags.get("Name") == "kafka_sg":
+                discovered["kafka_security_group"] = resource_id.split("/", 1)[1]
+            elif tags.get("Name") == "elastic_sg":
+                discovered["elastic_security_group"] = resource_id.split("/", 1)[1]
+    return discovered
+
+
+def lookup_kafka_brokers(kafka_arn: str) -> str:
+    """ get msk brokers from the kafka arn """
+    if not kafka_arn:
+        return ""
+    try:
+        kafka_client = boto3.session.Session().client("kafka")
+        return kafka_client.get_bootstrap_brokers(ClusterArn=kafka_arn)[
+            "BootstrapBrokerString"
+        ]
+    except ClientError as err:
+        print(f"Unexpectedd error: {err}")
+    return ""
+
+
+def lookup_elastic_endpoint(elastic_domain: str) -> str:
+    """ get elastic endpoint using elastic domain """
+    if not elastic_domain:
+        return ""
+    try:
+        es_client = boto3.session.Session().client("es")
+        return es_client.describe_elasticsearch_domain(DomainName=elastic_domain)[
+            "DomainStatus"
+        ]["Endpoints"]["vpc"]
+    except (ClientError, KeyError) as err:
+        # no endpoint until the domain has finished creating
+        print(f"Elastic endpoint not available: {err}")
+    return ""
+
+
+def discover(refresh: bool = False) -> dict:
+    """ resolve all the existing elkk resources once, using the disk cache if current """
+    global _discovered
+    with _discovered_lock:
+        if _discovered and not refresh:
+            return _discovered
+        _discovered = discover_resources(refresh)
+        return _discovered
+
+
+def discover_resources(refresh: bool = False) -> dict:
+    """ read the resources from the cache, or look them up and cache them """
+    resources = {} if refresh else read_cache()
+    if not resources:
+        resources = classify_resources(tagged_resources())
+        # the brokers and endpoint lookups are independent, run them together
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            kafka_brokers = executor.submit(
+                lookup_kafka_brokers, resources["kafka_arn"]
+            )
+            elastic_endpoint = executor.submit(
+                lookup_elastic_endpoint, resources["elastic_domain"]
+            )
+            resources["kafka_brokers"] = kafka_brokers.result()
+            resources["elastic_endpoint"] = elastic_endpoint.result()
+        write_cache(resources)
+    return resources
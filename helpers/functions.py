@@ -1,9 +1,18 @@
 # modules
 import os
+import re
+import sys
+import math
+import shutil
+import subprocess
+import jsii
 import boto3
 from botocore.exceptions import ClientError
 from helpers.constants import constants
-from pathlib import Path
+from helpers.discovery import discover
+from functools import lru_cache
+import threading
+import urllib.request
 import hashlib
 from aws_cdk import (
     core,
@@ -12,17 +21,54 @@ from aws_cdk import (
     aws_logs as logs,
 )
 
-# set boto3 client for amazon managged kafka
-kafkaclient = boto3.client("kafka")
-# set the boto3 client for amazon elasticsearch
-esclient = boto3.client("es")
-# set the boto3 client for amazon iam
-iamclient = boto3.client("iam")
-# set the client for logs
-logs_client = boto3.client("logs")
+
+# boto3 client creation is not thread safe
+_aws_client_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def aws_client(service_name: str):
+    """ create a boto3 client on first use rather than at import """
+    with _aws_client_lock:
+        return boto3.client(service_name)
+
+
+# operator public ip, resolved at most once per process
+_external_ip = None
+_external_ip_lock = threading.Lock()
+
+
+def set_external_ip(ip: str = None):
+    """ set the operator public ip, e.g. for offline synth, or None to resolve again """
+    global _external_ip
+    with _external_ip_lock:
+        _external_ip = ip
+
+
+def get_external_ip(scope: core.Construct = None) -> str:
+    """ get the operator public ip from cdk context, env var or ident.me """
+    global _external_ip
+    with _external_ip_lock:
+        if _external_ip is None:
+            external_ip = scope.node.try_get_context("external_ip") if scope else None
+            external_ip = external_ip or os.environ.get("ELKK_EXTERNAL_IP")
+            if not external_ip:
+                try:
+                    with urllib.request.urlopen(
+                        "https://ident.me", timeout=constants["EXTERNAL_IP_TIMEOUT"]
+                    ) as response:
+                        external_ip = response.read().decode("utf8").strip()
+                except OSError as err:
+                    raise RuntimeError(
+                        f"Unable to get the public ip ({err}), "
+                        "set it with -c external_ip=x.x.x.x or ELKK_EXTERNAL_IP"
+                    )
+            _external_ip = external_ip
+        return _external_ip
+
 
 # helper to create updated assets
-def file_updated(file_name: str = "", updates: dict = {}):
+def file_updated(file_name: str = "", updates: dict = {}, asset_name: str = ""):
     # read in the original file
     with open(file_name, "r") as f:
         filedata = f.read()
@@ -30,17 +76,175 @@ def file_updated(file_name: str = "", updates: dict = {}):
     for key, value in updates.items():
         if value != "":
             filedata = filedata.replace(key, value)
-    # save temp version of the file
-    with open(f"{file_name}.asset", "w") as f:
+    # save temp version of the file, by default next to the original
+    asset_name = asset_name or f"{file_name}.asset"
+    with open(asset_name, "w") as f:
         f.write(filedata)
     # return name of updated file
-    return f"{file_name}.asset"
+    return asset_name
+
+
+def yaml_settings(settings: dict, indent: int = 0) -> str:
+    """ flat yaml settings, one per line """
+    lines = []
+    for key, value in settings.items():
+        if isinstance(value, bool):
+            value = str(value).lower()
+        lines.append(f"{key}: {value}")
+    return f"\n{' ' * indent}".join(lines)
+
+
+def pipeline_topics_pattern(pipeline_id: str) -> str:
+    """ the kafka topics pattern of a logstash pipeline, an empty pattern takes
+    the topics no other pipeline does and that aren't ignored """
+    pipelines = constants["LOGSTASH_PIPELINES"]
+    if pipelines[pipeline_id]["topics_pattern"]:
+        return pipelines[pipeline_id]["topics_pattern"]
+    others = [
+        settings["topics_pattern"]
+        for settings in pipelines.values()
+        if settings["topics_pattern"]
+    ] + constants["LOGSTASH_IGNORED_TOPICS"]
+    return f"(?!({'|'.join(others)})$).*" if others else ".*"
+
+
+def logstash_pipeline(topic: str) -> str:
+    """ the logstash pipeline reading a topic, None if none does """
+    for pipeline_id in constants["LOGSTASH_PIPELINES"]:
+        if re.fullmatch(pipeline_topics_pattern(pipeline_id), topic):
+            return pipeline_id
+    return None
+
+
+def logstash_consumer_threads(topic: str) -> int:
+    """ the most logstash consumer threads reading a topic, from its pipeline
+    and the most fargate tasks """
+    pipeline_id = logstash_pipeline(topic)
+    if pipeline_id is None:
+        return 0
+    return (
+        constants["LOGSTASH_PIPELINES"][pipeline_id]["consumer_threads"]
+        * constants["LOGSTASH_FARGATE_MAX_CAPACITY"]
+    )
+
+
+def kafka_topic_plan() -> dict:
+    """ the partitions of each kafka topic, enough for its target MB/s and for
+    every logstash consumer thread, and the consumer threads reading it """
+    plan = {}
+    brokers = constants["KAFKA_BROKER_NODES"]
+    for topic, spec in constants["KAFKA_TOPICS"].items():
+        consumers = logstash_consumer_threads(topic)
+        partitions = spec.get("partitions")
+        if not partitions:
+            partitions = max(
+                math.ceil(spec["target_mbps"] / constants["KAFKA_PARTITION_MBPS"]),
+                consumers,
+                1,
+            )
+            # the same partitions on every broker
+            partitions = math.ceil(partitions / brokers) * brokers
+        plan[topic] = {"partitions": partitions, "consumers": consumers}
+    return plan
+
+
+def logstash_consumer_groups() -> dict:
+    """ the logstash consumer group reading each kafka topic """
+    return {
+        topic: f"logstash-{logstash_pipeline(topic)}"
+        for topic in constants["KAFKA_TOPICS"]
+        if logstash_pipeline(topic)
+    }
+
 
+def logstash_task_cap() -> int:
+    """ the most logstash tasks that each get a partition of some topic to read """
+    cap = 1
+    for topic, plan in kafka_topic_plan().items():
+        pipeline_id = logstash_pipeline(topic)
+        if pipeline_id:
+            threads = constants["LOGSTASH_PIPELINES"][pipeline_id]["consumer_threads"]
+            cap = max(cap, math.ceil(plan["partitions"] / threads))
+    return cap
 
+
+# helper to create a conf asset for each logstash pipeline
+def pipeline_confs(conf_file: str = "", updates: dict = {}) -> dict:
+    """ the conf of each of the logstash pipelines, consuming its own topics """
+    confs = {}
+    for pipeline_id, settings in constants["LOGSTASH_PIPELINES"].items():
+        confs[pipeline_id] = file_updated(
+            conf_file,
+            dict(
+                updates,
+                **{
+                    "$pipeline_id": pipeline_id,
+                    "$topics_pattern": pipeline_topics_pattern(pipeline_id),
+                    "$consumer_threads": str(settings["consumer_threads"]),
+                },
+            ),
+            asset_name=os.path.join(
+                os.path.dirname(conf_file), f"{pipeline_id}.conf.asset"
+            ),
+        )
+    return confs
+
+
+# helper to create the pipelines.yml asset
+def pipelines_updated(asset_name: str = "", conf_dir: str = "") -> str:
+    """ the pipelines.yml for the logstash pipelines, with their confs in conf_dir """
+    lines = []
+    for pipeline_id, settings in constants["LOGSTASH_PIPELINES"].items():
+        lines += [
+            f"- pipeline.id: {pipeline_id}",
+            f'  path.config: "{conf_dir}/{pipeline_id}.conf"',
+            f"  pipeline.workers: {settings['workers']}",
+            f"  pipeline.batch.size: {settings['batch_size']}",
+        ]
+    with open(asset_name, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return asset_name
+
+
+@jsii.implements(core.ILocalBundling)
+class PipBundling:
+    """ bundles a lambda asset and its pure python requirements with the local
+    pip, so synth doesn't need docker, which is only used if pip fails """
+
+    def __init__(self, source_dir: str):
+        self.source_dir = source_dir
+
+    def try_bundle(self, output_dir: str, options: core.BundlingOptions) -> bool:
+        installed = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "pip",
+                "install",
+                "--quiet",
+                "--disable-pip-version-check",
+                "-r",
+                os.path.join(self.source_dir, "requirements.txt"),
+                "-t",
+                output_dir,
+            ]
+        )
+        if installed.returncode:
+            return False
+        shutil.copytree(
+            self.source_dir,
+            output_dir,
+            ignore=shutil.ignore_patterns("__pycache__"),
+            dirs_exist_ok=True,
+        )
+        return True
+
+
+@lru_cache(maxsize=None)
 def ensure_service_linked_role(service_name: str):
     """ create the serviced linked role if it doesn't exist for a service """
     try:
-        iamclient.create_service_linked_role(AWSServiceName=service_name)
+        aws_client("iam").create_service_linked_role(AWSServiceName=service_name)
     except ClientError as err:
         if (
             err.response["Error"]["Code"] == "InvalidInput"
@@ -54,102 +258,33 @@ def ensure_service_linked_role(service_name: str):
 
 
 def kafka_get_arn() -> str:
-    """ get the arn for the kakfa cluster startingwith elkk- """
-    kafka_clusters = kafkaclient.list_clusters()
-    try:
-        return [
-            clstr["ClusterArn"]
-            for clstr in kafka_clusters["ClusterInfoList"]
-            if clstr["Tags"]["project"] == constants["PROJECT_TAG"]
-        ][0]
-    except IndexError:
-        return ""
+    """ get the arn for the kakfa cluster with the project tag """
+    return discover()["kafka_arn"]
 
 
 def kafka_get_brokers() -> str:
     """ get msk brokers from the kafka arn """
-    try:
-        kafka_brokers = kafkaclient.get_bootstrap_brokers(ClusterArn=kafka_get_arn())
-        return kafka_brokers["BootstrapBrokerString"]
-    except ClientError as err:
-        if (
-            err.response["Error"]["Message"]
-            == "Missing required request parameters: [clusterArn]"
-        ):
-            return ""
-        else:
-            print(f"Unexpectedd error: {err}")
-    return ""
-
-
-def elastic_get_arn() -> str:
-    """ get the elastic domain using the project tag """
-    pass
+    return discover()["kafka_brokers"]
 
 
 def elastic_get_domain() -> str:
     """ get elastic domain using the project tag """
-    es_domains = esclient.list_domain_names()
-    try:
-        return [
-            dom["DomainName"]
-            for dom in es_domains["DomainNames"]
-            if "elkk-" in dom["DomainName"]
-        ][0]
-    except IndexError:
-        return ""
+    return discover()["elastic_domain"]
 
 
 def elastic_get_endpoint() -> str:
     """ get elastic endpoint using elastic domain """
-    es_endpoint = esclient.describe_elasticsearch_domain(
-        DomainName=elastic_get_domain()
-    )
-    return es_endpoint["DomainStatus"]["Endpoints"]["vpc"]
+    return discover()["elastic_endpoint"]
 
 
-def update_kafka_configuration(config_file):
-    """ ensure the configuration has auto enable topic """
-    # check if config exists
-    try:
-        config_arn = [
-            config
-            for config in kafkaclient.list_configurations()["Configurations"]
-            if config["Name"] == constants["PROJECT_TAG"]
-        ][0]["Arn"]
-    except IndexError as err:
-        # create the config if it does not exist
-        config_arn = kafkaclient.create_configuration(
-            Description="Elkk Configuration",
-            KafkaVersions=[constants["KAFKA_VERSION"]],
-            Name=constants["PROJECT_TAG"],
-            ServerProperties=Path("kafka/configuration.txt").read_text(),
-        )["Arn"]
-    try:
-        # check the config arn attached to the cluster
-        kafka_config_arn = kafkaclient.describe_cluster(ClusterArn=kafka_get_arn())[
-            "ClusterInfo"
-        ]["CurrentBrokerSoftwareInfo"]["ConfigurationArn"]
-    except KeyError as err:
-        # if not found then must be using default, get cluster version
-        kafka_cluster_version = kafkaclient.describe_cluster(
-            ClusterArn=kafka_get_arn()
-        )["ClusterInfo"]["CurrentVersion"]
-        # update cluster with configuration
-        return kafka_get_arn()
-        # park this for now
-        try:
-            kafkaclient.update_cluster_configuration(
-                ClusterArn=kafka_get_arn(),
-                ConfigurationInfo={"Arn": kafka_config_arn, "Revision": 1},
-                CurrentVersion=kafka_cluster_version,
-            )
-        except ClientError as err:
-            if err.response["Error"]["Code"] == "BadRequestException":
-                pass
-            else:
-                print(f"Unexpectedd error: {err}")
-    return kafka_get_arn()
+def kafka_server_properties() -> str:
+    """ the msk server properties of the broker profile in constants """
+    lines = []
+    for key, value in constants["KAFKA_BROKER_PROPERTIES"].items():
+        if isinstance(value, bool):
+            value = str(value).lower()
+        lines.append(f"{key} = {value}")
+    return "\n".join(lines) + "\n"
 
 
 def user_data_init(log_group_name: str = None):
@@ -192,7 +327,7 @@ def instance_add_log_permissions(the_instance):
 def get_log_group_arn(log_group_name):
     """ get it if exists """
     # search for log group
-    log_groups = logs_client.describe_log_groups(logGroupNamePrefix=log_group_name)[
+    log_groups = aws_client("logs").describe_log_groups(logGroupNamePrefix=log_group_name)[
         "logGroups"
     ]
     try:
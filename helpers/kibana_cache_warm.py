@@ -0,0 +1,102 @@
+# the main lambda function
+def main(event: dict, context: object) -> dict:
+
+    import logging as log
+    import re
+    import json
+    import base64
+    import cfnresponse
+    import boto3
+    from concurrent.futures import ThreadPoolExecutor
+
+    log.getLogger().setLevel(log.INFO)
+
+    # This needs to change if there are to be multiple resources
+    # in the same stack
+    physical_id = event["ResourceProperties"]["PhysicalId"]
+
+    # set clients
+    la_client = boto3.client("lambda")
+    s3_client = boto3.client("s3")
+
+    props = event["ResourceProperties"]
+    # static assets referenced by kibana pages and bundles
+    asset_pattern = re.compile(
+        r"""["'`]({}/[^"'`\s]+?\.(?:js|css|woff2?|ttf|eot|svg|png|jpg|gif|ico))["'`?]""".format(
+            re.escape(props["KibanaPath"])
+        )
+    )
+
+    def proxy(path: str) -> tuple:
+        """ GET a path through the kibana proxy lambda, return the status code
+        and any text body """
+        payload = {
+            "path": path,
+            "httpMethod": "GET",
+            "headers": {"accept": "*/*"},
+            "queryStringParameters": None,
+            "body": None,
+        }
+        response = json.loads(
+            la_client.invoke(
+                FunctionName=props["FunctionName"], Payload=json.dumps(payload)
+            )["Payload"].read()
+        )
+        status = response.get("statusCode")
+        if status == "301" and "bootstrap" in path:
+            # the bootstrap lists the bundles, read it back from the cache
+            cached = s3_client.get_object(
+                Bucket=props["BucketName"], Key=f"bucket_cached{path}"
+            )
+            return status, cached["Body"].read().decode("utf-8", "ignore")
+        if response.get("isBase64Encoded"):
+            return status, base64.b64decode(response["body"]).decode("utf-8", "ignore")
+        return status, ""
+
+    def cached(path: str, status: str) -> bool:
+        """ the proxy redirects to an asset once it is in the cache bucket """
+        if status != "301":
+            log.warning(f"{path} not cached, status {status}")
+        return status == "301"
+
+    try:
+        log.info(f"Input event: {event}")
+
+        # Warm the cache if event is create or update
+        results = []
+        if event["RequestType"] in ["Create", "Update"]:
+            try:
+                # crawl the app page, then the bootstraps it references
+                status, app_page = proxy(f'{props["KibanaPath"]}/app/kibana')
+                if status != "200":
+                    raise RuntimeError(f"Kibana app page returned status {status}")
+                pending = set(asset_pattern.findall(app_page))
+                bootstraps = [path for path in pending if "bootstrap" in path]
+                for path in bootstraps:
+                    status, bootstrap = proxy(path)
+                    results.append(cached(path, status))
+                    pending.update(asset_pattern.findall(bootstrap))
+                pending.difference_update(bootstraps)
+                # fetch everything else concurrently, each is cached by the proxy
+                concurrency = int(props["Concurrency"])
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    results.extend(
+                        executor.map(
+                            lambda path: cached(path, proxy(path)[0]), sorted(pending)
+                        )
+                    )
+            except Exception as e:
+                # a cold cache is still filled on request, don't fail the stack
+                log.exception(e)
+
+        # do some reporting, only assets the proxy redirected to are cached
+        warmed = sum(results)
+        attributes = {
+            "Response": f"{warmed} assets cached, {len(results) - warmed} not cached"
+        }
+        cfnresponse.send(event, context, cfnresponse.SUCCESS, attributes, physical_id)
+
+    except Exception as e:
+        log.exception(e)
+        # cfnresponse's error message is always "see CloudWatch"
+        cfnresponse.send(event, context, cfnresponse.FAILED, {}, physical_id)
@@ -4,7 +4,6 @@ def main(event: dict, context: object) -> dict:
     import logging as log
     import cfnresponse
     import boto3
-    from botocore.exceptions import ClientError
 
     log.getLogger().setLevel(log.INFO)
 
@@ -15,7 +14,7 @@ def main(event: dict, context: object) -> dict:
     # set clients
     la_client = boto3.client("lambda")
     cf_client = boto3.client("cloudfront")
-    s3_client = boto3.client("s3")
+    tag_client = boto3.client("resourcegroupstaggingapi")
     es_client = boto3.client("es")
 
     try:
@@ -47,21 +46,13 @@ def main(event: dict, context: object) -> dict:
                 if "elkk-kibana" in dist["Origins"]["Items"][0]["DomainName"]
             ][0]
 
-            # get the s3 bucket name
-            s3_bucket_list = s3_client.list_buckets()
-            for bkt in s3_bucket_list["Buckets"]:
-                try:
-                    bkt_tags = s3_client.get_bucket_tagging(Bucket=bkt["Name"])[
-                        "TagSet"
-                    ]
-                    for keypairs in bkt_tags:
-                        if (
-                            keypairs["Key"] == "aws:cloudformation:stack-name"
-                            and keypairs["Value"] == "elkk-kibana"
-                        ):
-                            kibana_bucket_name = bkt["Name"]
-                except ClientError:
-                    pass
+            # get the s3 bucket name from its stack tag
+            kibana_bucket_name = tag_client.get_resources(
+                TagFilters=[
+                    {"Key": "aws:cloudformation:stack-name", "Values": ["elkk-kibana"]}
+                ],
+                ResourceTypeFilters=["s3"],
+            )["ResourceTagMappingList"][0]["ResourceARN"].split(":")[-1]
 
             # get the elastic endpoint details
             es_domains = es_client.list_domain_names()
@@ -77,19 +68,24 @@ def main(event: dict, context: object) -> dict:
             es_endpoint = es_client.describe_elasticsearch_domain(DomainName=es_domain)
             elastic_endpoint = es_endpoint["DomainStatus"]["Endpoints"]["vpc"]
 
-            # update the functions env
+            # update the functions env with the tuning settings and endpoints
+            env = la_client.get_function_configuration(FunctionName=api_function)
+            env = env.get("Environment", {}).get("Variables", {})
+            env.update(event["ResourceProperties"].get("LambdaEnv", {}))
+            env.update(
+                {
+                    "AES_DOMAIN_ENDPOINT": f"https://{elastic_endpoint}",
+                    "KIBANA_BUCKET": kibana_bucket_name,
+                    "S3_MAX_AGE": "2629746",
+                    "LOG_LEVEL": "warning",
+                    "CLOUDFRONT_CACHE_URL": f"https://{cloudfront_domain}/bucket_cached",
+                }
+            )
             update_env = la_client.update_function_configuration(
-                FunctionName=api_function,
-                Environment={
-                    "Variables": {
-                        "AES_DOMAIN_ENDPOINT": f"https://{elastic_endpoint}",
-                        "KIBANA_BUCKET": kibana_bucket_name,
-                        "S3_MAX_AGE": "2629746",
-                        "LOG_LEVEL": "warning",
-                        "CLOUDFRONT_CACHE_URL": f"https://{cloudfront_domain}/bucket_cached",
-                    }
-                },
+                FunctionName=api_function, Environment={"Variables": env},
             )
+            # the cache warm that follows needs the function on the new env
+            la_client.get_waiter("function_updated").wait(FunctionName=api_function)
         # do some reporting
         attributes = {"Response": update_env}
         cfnresponse.send(event, context, cfnresponse.SUCCESS, attributes, physical_id)
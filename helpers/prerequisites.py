@@ -0,0 +1,73 @@
+# modules
+import sys
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from aws_cdk import core
+from helpers.discovery import discover
+from helpers.functions import (
+    ensure_service_linked_role,
+    get_external_ip,
+)
+
+
+@contextmanager
+def timed(timings: dict, name: str):
+    """ record the seconds spent in the block against name """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def resolve_prerequisites(scope: core.Construct, refresh: bool = False) -> dict:
+    """ run the independent lookups the stacks need concurrently, before any stack is built """
+    lookups = {
+        "discovery": lambda: discover(refresh=refresh),
+        "external_ip": lambda: get_external_ip(scope),
+        "kafka_service_role": lambda: ensure_service_linked_role("kafka.amazonaws.com"),
+        "elastic_service_role": lambda: ensure_service_linked_role("es.amazonaws.com"),
+    }
+    timings = {}
+
+    def run_lookup(name):
+        with timed(timings, name):
+            return lookups[name]()
+
+    wall = {}
+    with timed(wall, "prerequisites"):
+        with ThreadPoolExecutor(max_workers=len(lookups)) as executor:
+            futures = {name: executor.submit(run_lookup, name) for name in lookups}
+            results = {name: future.result() for name, future in futures.items()}
+    return {"results": results, "timings": timings, "wall": wall["prerequisites"]}
+
+
+def print_timing_report(
+    construct_timings: dict,
+    prerequisites: dict,
+    stack_lookups: dict,
+    synth_time: float = 0,
+):
+    """ print the construct and lookup seconds for each stack, then the totals
+    with the app synth """
+    lookup_timings = prerequisites["timings"]
+    lines = [
+        "synth timing (lookups run concurrently and are shared between stacks)",
+        f'{"stack":<16}{"construct":>12}{"lookup":>12}  lookups',
+    ]
+    for stack_name, construct_time in construct_timings.items():
+        names = stack_lookups.get(stack_name, [])
+        lookup_time = sum(lookup_timings.get(name, 0) for name in names)
+        lines.append(
+            f'{stack_name:<16}{construct_time:>11.2f}s{lookup_time:>11.2f}s  {", ".join(names)}'
+        )
+    construct_total = sum(construct_timings.values())
+    lines.append(
+        f'{"stacks":<16}{construct_total:>11.2f}s{prerequisites["wall"]:>11.2f}s  (lookup wall time)'
+    )
+    lines.append(f'{"synth":<16}{synth_time:>11.2f}s{"":>12}  (writing the templates and assets)')
+    lines.append(
+        f'{"total":<16}{construct_total + prerequisites["wall"] + synth_time:>11.2f}s'
+    )
+    print("\n".join(lines), file=sys.stderr)
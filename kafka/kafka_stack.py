@@ -1,10 +1,5 @@
 # import modules
 import os
-import io
-
-import boto3
-from botocore.exceptions import ClientError
-import urllib.request
 from aws_cdk import (
     core,
     aws_msk as msk,
@@ -13,26 +8,29 @@ from aws_cdk import (
     aws_s3_assets as assets,
 )
 
-kafka = boto3.client("kafka")
-
 # get constants
 from helpers.constants import constants
 from helpers.functions import (
     file_updated,
-    kafka_get_brokers,
     ensure_service_linked_role,
-    update_kafka_configuration,
+    kafka_server_properties,
+    kafka_topic_plan,
     user_data_init,
+    get_external_ip,
     instance_add_log_permissions,
 )
 
 dirname = os.path.dirname(__file__)
-external_ip = urllib.request.urlopen("https://ident.me").read().decode("utf8")
 
 
 class KafkaStack(core.Stack):
     def __init__(
-        self, scope: core.Construct, id: str, vpc_stack, client: bool = True, **kwargs
+        self,
+        scope: core.Construct,
+        id: str,
+        vpc_stack,
+        client: bool = True,
+        **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
@@ -57,6 +55,8 @@ class KafkaStack(core.Stack):
         )
         core.Tag.add(self.kafka_client_security_group, "Name", "kafka_client_sg")
 
+        # operator public ip for ssh
+        external_ip = get_external_ip(self)
         # Open port 22 for SSH
         self.kafka_client_security_group.add_ingress_rule(
             ec2.Peer.ipv4(f"{external_ip}/32"), ec2.Port.tcp(22), "from own public ip",
@@ -88,6 +88,18 @@ class KafkaStack(core.Stack):
             self.kafka_security_group, ec2.Port.all_traffic(), "from kafka",
         )
 
+        # the msk configuration with the broker profile, a changed profile is a
+        # new revision, a new kafka version a new configuration
+        kafka_configuration = msk.CfnConfiguration(
+            self,
+            "kafka_configuration",
+            name=f'{constants["PROJECT_TAG"]}-'
+            f'{constants["KAFKA_VERSION"].replace(".", "-")}',
+            description="Elkk Configuration",
+            kafka_versions_list=[constants["KAFKA_VERSION"]],
+            server_properties=kafka_server_properties(),
+        )
+
         # create the kafka cluster
         self.kafka_cluster = msk.CfnCluster(
             self,
@@ -108,9 +120,28 @@ class KafkaStack(core.Stack):
             kafka_version=constants["KAFKA_VERSION"],
             number_of_broker_nodes=constants["KAFKA_BROKER_NODES"],
             enhanced_monitoring="DEFAULT",
+            configuration_info={
+                "arn": kafka_configuration.attr_arn,
+                "revision": core.Token.as_number(
+                    core.Fn.get_att(
+                        kafka_configuration.logical_id, "LatestRevision.Revision"
+                    )
+                ),
+            },
         )
         core.Tag.add(self.kafka_cluster, "project", constants["PROJECT_TAG"])
 
+        # partitions for the throughput and the consumers of each topic
+        topic_plan = kafka_topic_plan()
+        for topic, plan in topic_plan.items():
+            if plan["consumers"] > plan["partitions"]:
+                self.node.add_warning(
+                    f"{topic} has {plan['partitions']} partitions for up to "
+                    f"{plan['consumers']} logstash consumer threads, "
+                    f"{plan['consumers'] - plan['partitions']} will sit idle"
+                )
+        kafka_topics = f"/opt/{constants['KAFKA_DOWNLOAD_VERSION']}/bin/kafka-topics.sh"
+
         # instance for kafka client
         if client == True:
             # userdata for kafka client
@@ -165,10 +196,15 @@ class KafkaStack(core.Stack):
                 f"kafka_arn=`aws kafka list-clusters --region {core.Aws.REGION} --output text --query 'ClusterInfoList[*].ClusterArn'`",
                 # get the zookeeper
                 f"kafka_zookeeper=`aws kafka describe-cluster --cluster-arn $kafka_arn --region {core.Aws.REGION} --output text --query 'ClusterInfo.ZookeeperConnectString'`",
-                # create the topics
-                f"make_topic=`/opt/{constants['KAFKA_DOWNLOAD_VERSION']}/bin/kafka-topics.sh --create --zookeeper $kafka_zookeeper --replication-factor 3 --partitions 1 --topic elkktopic 2>&1`",
-                f"make_topic=`/opt/{constants['KAFKA_DOWNLOAD_VERSION']}/bin/kafka-topics.sh --create --zookeeper $kafka_zookeeper --replication-factor 3 --partitions 1 --topic apachelog 2>&1`",
-                f"make_topic=`/opt/{constants['KAFKA_DOWNLOAD_VERSION']}/bin/kafka-topics.sh --create --zookeeper $kafka_zookeeper --replication-factor 3 --partitions 1 --topic appevent 2>&1`",
+                # create the topics, or add partitions to the existing ones up to the plan
+                *[
+                    command
+                    for topic, plan in topic_plan.items()
+                    for command in (
+                        f"{kafka_topics} --create --if-not-exists --zookeeper $kafka_zookeeper --replication-factor {constants['KAFKA_REPLICATION_FACTOR']} --partitions {plan['partitions']} --topic {topic}",
+                        f"[ `{kafka_topics} --describe --zookeeper $kafka_zookeeper --topic {topic} | grep -c 'Partition: '` -ge {plan['partitions']} ] || {kafka_topics} --alter --zookeeper $kafka_zookeeper --topic {topic} --partitions {plan['partitions']}",
+                    )
+                ],
             )
             # add the signal
             kafka_client_userdata.add_signal_on_exit_command(
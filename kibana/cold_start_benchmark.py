@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# get modules
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import tempfile
+import zipfile
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+
+# initiate the parse
+parser = argparse.ArgumentParser(
+    description="Measure the import time of the kibana proxy lambda with -X importtime"
+)
+parser.add_argument(
+    "-p",
+    "--package",
+    dest="package",
+    help="Lambda zip or directory to import from, defaults to kibana_lambda.zip",
+    type=str,
+    default=os.path.join(dirname, "kibana_lambda.zip"),
+)
+parser.add_argument(
+    "-r",
+    "--runs",
+    dest="runs",
+    help="Number of cold imports to measure",
+    type=int,
+    default=10,
+)
+parser.add_argument(
+    "-t",
+    "--top",
+    dest="top",
+    help="Number of slowest modules to list",
+    type=int,
+    default=15,
+)
+
+
+def import_times(package_dir: str) -> dict:
+    """ import the lambda once in a fresh interpreter, return the cumulative us
+    of the lambda and of each module it imports directly """
+    env = dict(
+        os.environ,
+        PYTHONPATH=package_dir,
+        PYTHONDONTWRITEBYTECODE="1",
+        AES_DOMAIN_ENDPOINT="https://localhost",
+        CLOUDFRONT_CACHE_URL="https://localhost/bucket_cached",
+        KIBANA_BUCKET="kibana-bucket",
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import lambda_function"],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    children = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        # nested imports are indented two spaces per level
+        module = module[1:].rstrip()
+        depth = (len(module) - len(module.lstrip())) // 2
+        # children are listed before the module that imported them
+        if depth == 1:
+            children[module.strip()] = int(cumulative)
+        elif depth == 0:
+            if module == "lambda_function":
+                times = dict(children, lambda_function=int(cumulative))
+            children = {}
+    return times
+
+
+def main():
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        package_dir = args.package
+        if zipfile.is_zipfile(args.package):
+            # import from the unzipped package, as lambda does
+            with zipfile.ZipFile(args.package) as package_zip:
+                package_zip.extractall(tmp_dir)
+            package_dir = tmp_dir
+        runs = [import_times(package_dir) for _ in range(args.runs)]
+
+    totals = [run.get("lambda_function", 0) / 1000 for run in runs]
+    print(f"cold import of lambda_function over {args.runs} runs (ms)")
+    print(
+        f"  median {statistics.median(totals):.1f}  min {min(totals):.1f}  max {max(totals):.1f}"
+    )
+    # the slowest top level modules, by median cumulative time
+    modules = {
+        module: statistics.median(run.get(module, 0) for run in runs) / 1000
+        for module in runs[0]
+        if module != "lambda_function"
+    }
+    print("slowest modules imported by lambda_function (ms)")
+    for module, median in sorted(modules.items(), key=lambda m: -m[1])[: args.top]:
+        print(f"  {median:8.1f}  {module}")
+
+
+if __name__ == "__main__":
+    main()
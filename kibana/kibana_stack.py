@@ -11,12 +11,12 @@ from aws_cdk import (
     aws_logs as logs,
 )
 import pathlib
+import hashlib
 
 from aws_cdk.aws_cloudfront import CfnDistribution
 
 from helpers.constants import constants
 from helpers.custom_resource import CustomResource
-from helpers.functions import elastic_get_endpoint, elastic_get_domain
 
 dirname = os.path.dirname(__file__)
 
@@ -181,9 +181,11 @@ class KibanaStack(core.Stack):
                     "s3:ListBucket",
                     "s3:ListAllMyBuckets",
                     "lambda:ListFunctions",
+                    "lambda:GetFunctionConfiguration",
                     "lambda:UpdateFunctionConfiguration",
                     "cloudfront:ListDistributions",
                     "s3:GetBucketTagging",
+                    "tag:GetResources",
                     "es:ListDomainNames",
                     "es:DescribeElasticsearchDomain",
                 ],
@@ -198,6 +200,14 @@ class KibanaStack(core.Stack):
             PhysicalId="kibanaLambdaUpdate",
             Uuid="f7d4f230-4ee1-07e8-9c2d-fa7ae06bbebc",
             HandlerPath=os.path.join(dirname, "../helpers/lambda_env_update.py"),
+            # set with the endpoints, so a change to them updates the env again
+            LambdaEnv={
+                "KIBANA_VERSION": constants["ELASTIC_VERSION"],
+                **{
+                    key: str(value)
+                    for key, value in constants["KIBANA_LAMBDA_ENV"].items()
+                },
+            },
             ResourcePolicies=kibana_lambda_update_policy,
         )
         # tag the lamdbda
@@ -205,6 +215,44 @@ class KibanaStack(core.Stack):
         # needs a dependancy
         kibana_lambda_update.node.add_dependency(kibana_bucket)
         kibana_lambda_update.node.add_dependency(kibana_distribution)
+        kibana_lambda_update.node.add_dependency(kibana_lambda)
+
+        # kibana cache warm policies
+        kibana_cache_warm_policy = [
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["lambda:InvokeFunction"],
+                resources=[kibana_lambda.function_arn],
+            ),
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["s3:GetObject"],
+                resources=[f"{kibana_bucket.bucket_arn}/bucket_cached/*"],
+            ),
+        ]
+        # create the kibana cache warm, runs on stack create and update
+        kibana_cache_warm = CustomResource(
+            self,
+            "kibana_cache_warm",
+            Description="Fill the kibana cache s3 bucket",
+            PhysicalId="kibanaCacheWarm",
+            Uuid="f7d4f230-4ee1-07e8-9c2d-fa7ae06bcaf3",
+            HandlerPath=os.path.join(dirname, "../helpers/kibana_cache_warm.py"),
+            FunctionName=kibana_lambda.function_name,
+            BucketName=kibana_bucket.bucket_name,
+            KibanaPath="/_plugin/kibana",
+            KibanaVersion=constants["ELASTIC_VERSION"],
+            Concurrency=constants["KIBANA_CACHE_WARM_CONCURRENCY"],
+            # a new lambda build or kibana version warms the cache again
+            LambdaHash=hashlib.md5(
+                pathlib.Path(os.path.join(dirname, "kibana_lambda.zip")).read_bytes()
+            ).hexdigest(),
+            ResourcePolicies=kibana_cache_warm_policy,
+        )
+        # tag the lamdbda
+        core.Tag.add(kibana_cache_warm, "project", constants["PROJECT_TAG"])
+        # needs the lambda env to be updated first
+        kibana_cache_warm.node.add_dependency(kibana_lambda_update)
 
         core.CfnOutput(
             self,
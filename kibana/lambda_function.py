@@ -1,15 +1,28 @@
 # modules
 import os
 import logging
-import requests
+import urllib3
+from urllib3.util.retry import Retry
+import certifi
 import json
 import base64
+import gzip
+import hashlib
+import re
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional, Tuple, Union
-import boto3
+from functools import partial
 from io import BytesIO
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlsplit, parse_qsl
 
-s3 = boto3.client("s3")
+try:
+    import brotli
+except ImportError:
+    # brotli is optional, gzip is always available
+    brotli = None
 
 # settings ...
 AES_DOMAIN_ENDPOINT = os.environ.get("AES_DOMAIN_ENDPOINT")
@@ -18,16 +31,57 @@ KIBANA_BUCKET = os.environ.get("KIBANA_BUCKET")
 S3_MAX_AGE = os.environ.get("S3_MAX_AGE", "2629746")
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "warning")
 CACHEABLE_TYPES = ["image", "javascript", "css", "font"]
+# static asset paths that may already be in the cache bucket
+CACHEABLE_EXTENSIONS = (
+    ".js",
+    ".css",
+    ".woff",
+    ".woff2",
+    ".ttf",
+    ".eot",
+    ".svg",
+    ".png",
+    ".jpg",
+    ".gif",
+    ".ico",
+)
+# compress proxied responses of these types from this size (bytes)
+COMPRESSIBLE_TYPES = ["json", "text", "javascript", "xml"]
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", "5"))
+# lambda proxy responses are limited to 6 MB, leave room for the headers
+MAX_RESPONSE_SIZE = 6 * 1024 * 1024 - 16 * 1024
+# cached objects are only valid for the kibana version that served them
+KIBANA_VERSION = os.environ.get("KIBANA_VERSION", "")
 ACCEPTED_HEADERS = ["accept", "host", "content-type"]
-METHOD_MAP = {
-    "get": requests.get,
-    "options": requests.options,
-    "put": requests.put,
-    "post": requests.post,
-    "head": requests.head,
-    "patch": requests.patch,
-    "delete": requests.delete,
-}
+# read only routes to cache in memory, with their ttl in seconds
+RESPONSE_CACHE_ROUTES = [
+    (re.compile(r"/api/status$"), 5),
+    (re.compile(r"/api/saved_objects/_find$"), 10),
+    (re.compile(r"/api/saved_objects/[^_/][^/]*/[^/]+$"), 10),
+    (re.compile(r"/api/index_patterns/_fields_for_wildcard$"), 30),
+    (re.compile(r"/_cat/[^/]+$"), 5),
+]
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024))
+)
+SAVED_OBJECTS_PATH = "/api/saved_objects/"
+# connection pool and retry settings for requests to ES
+POOL_SIZE = int(os.environ.get("POOL_SIZE", "10"))
+RETRY_TOTAL = int(os.environ.get("RETRY_TOTAL", "3"))
+RETRY_BACKOFF = float(os.environ.get("RETRY_BACKOFF", "0.2"))
+RETRY_STATUSES = [429, 502, 503]
+RETRY_METHODS = os.environ.get("RETRY_METHODS", "GET,HEAD,OPTIONS").split(",")
+# a write may be applied before a 502, 429 and 503 are rejected before processing
+RETRY_WRITE_STATUSES = [429, 503]
+# batched requests, fanned out to ES concurrently from one invocation
+BATCH_PATH = os.environ.get("BATCH_PATH", "/_elkk_batch")
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", "50"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(POOL_SIZE)))
+# read only ES endpoints that are sent as POST
+READ_ONLY_POSTS = re.compile(r"/_(m?search|count|field_caps)$")
+CONNECT_TIMEOUT = float(os.environ.get("CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.environ.get("READ_TIMEOUT", "60"))
 LOGGING_LEVELS = {
     "info": logging.INFO,
     "debug": logging.DEBUG,
@@ -49,6 +103,71 @@ else:
 logger = logging.getLogger()
 
 
+class ESRequestError(Exception):
+    """ an error response from ES, or no response at all """
+
+    def __init__(self, message: str, response: urllib3.HTTPResponse = None):
+        super().__init__(message)
+        self.response = response
+
+
+class WriteSafeRetry(Retry):
+    """ retries the idempotent methods on any retry status, and the others only
+    when ES rejected them without processing them """
+
+    def is_retry(
+        self, method: str, status_code: int, has_retry_after: bool = False
+    ) -> bool:
+        if not self._is_method_retryable(method):
+            return status_code in RETRY_WRITE_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def create_pool() -> urllib3.PoolManager:
+    """ a pooled keep-alive client with retries on throttled or unavailable ES """
+    retries = WriteSafeRetry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=RETRY_METHODS,
+        raise_on_status=False,
+    )
+    return urllib3.PoolManager(
+        maxsize=POOL_SIZE,
+        retries=retries,
+        timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=certifi.where(),
+    )
+
+
+# the pool is created once per container and reused by warm invocations
+http = create_pool()
+METHOD_MAP = {
+    "get": partial(http.request, "GET"),
+    "options": partial(http.request, "OPTIONS"),
+    "put": partial(http.request, "PUT"),
+    "post": partial(http.request, "POST"),
+    "head": partial(http.request, "HEAD"),
+    "patch": partial(http.request, "PATCH"),
+    "delete": partial(http.request, "DELETE"),
+}
+
+# the s3 client is only created when a response is cached
+_s3 = None
+_s3_lock = threading.Lock()
+
+
+def s3_client():
+    global _s3
+    with _s3_lock:
+        if _s3 is None:
+            import boto3
+
+            _s3 = boto3.client("s3")
+    return _s3
+
+
 def clean_body(event: dict) -> Optional[dict]:
     request_body = event.get("body")
     if event.get("isBase64Encoded", False) is True:
@@ -81,14 +200,14 @@ def generate_url(event: dict) -> Tuple[str, Optional[str]]:
 
 
 def exception_response(
-    e: requests.RequestException,
+    e: ESRequestError,
     body: Union[str, bytes, dict],
     params: Optional[str],
     clean_headers: dict,
 ):
     try:
         error = str(e.response.reason)
-        status_code = str(e.response.status_code)
+        status_code = str(e.response.status)
         headers = dict(e.response.headers)
     except AttributeError:
         error = str(e)
@@ -112,10 +231,12 @@ def exception_response(
     return response
 
 
-def error_response():
-    data = json.dumps({"error": "Environment incorrectly configured"})
+def error_response(
+    error: str = "Environment incorrectly configured", status_code: str = "500"
+):
+    data = json.dumps({"error": error})
     response = {
-        "statusCode": "500",
+        "statusCode": status_code,
         "body": data.encode("utf-8"),
         "headers": {"Content-Type": "application/json", "Cache-Control": "max-age=0"},
     }
@@ -123,12 +244,39 @@ def error_response():
     return response
 
 
-def redirect_to_object(data: bytes, event: dict, content_type: str):
-    data = BytesIO(data)
-    bucket_path = f'bucket_cached{event["path"]}'
-    s3.upload_fileobj(
-        data, KIBANA_BUCKET, bucket_path, ExtraArgs={"ContentType": content_type}
-    )
+# bucket keys known to be cached, kept across warm invocations
+# {bucket key: {"etag": md5 of the object, "version": kibana version}}
+CACHE_INDEX = {}
+
+
+def cache_key(event: dict) -> str:
+    return f'bucket_cached{event["path"]}'
+
+
+def is_static_asset(event: dict) -> bool:
+    return event["path"].lower().endswith(CACHEABLE_EXTENSIONS)
+
+
+def cached_object(key: str) -> bool:
+    """ check the index, then the bucket, for a current copy of the object """
+    entry = CACHE_INDEX.get(key)
+    if entry is None:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = s3_client().head_object(Bucket=KIBANA_BUCKET, Key=key)
+        except ClientError:
+            # not cached yet, or not readable, so fetch from ES
+            return False
+        entry = {
+            "etag": head["ETag"].strip('"'),
+            "version": head.get("Metadata", {}).get("kibana-version", ""),
+        }
+        CACHE_INDEX[key] = entry
+    return entry["version"] == KIBANA_VERSION
+
+
+def redirect_response(event: dict) -> dict:
     response = {
         "statusCode": "301",
         "body": None,
@@ -141,12 +289,80 @@ def redirect_to_object(data: bytes, event: dict, content_type: str):
     return response
 
 
-def proxied_request(data: Union[bytes, str], content_type: str):
+def redirect_to_object(data: bytes, event: dict, content_type: str):
+    bucket_path = cache_key(event)
+    etag = hashlib.md5(data).hexdigest()
+    entry = CACHE_INDEX.get(bucket_path)
+    metadata = {"kibana-version": KIBANA_VERSION}
+    if entry is None or entry["etag"] != etag:
+        # new or changed object, upload it
+        s3_client().upload_fileobj(
+            BytesIO(data),
+            KIBANA_BUCKET,
+            bucket_path,
+            ExtraArgs={"ContentType": content_type, "Metadata": metadata},
+        )
+    elif entry["version"] != KIBANA_VERSION:
+        # identical bytes from a new kibana version, only update the metadata
+        s3_client().copy_object(
+            Bucket=KIBANA_BUCKET,
+            Key=bucket_path,
+            CopySource={"Bucket": KIBANA_BUCKET, "Key": bucket_path},
+            ContentType=content_type,
+            Metadata=metadata,
+            MetadataDirective="REPLACE",
+        )
+    CACHE_INDEX[bucket_path] = {"etag": etag, "version": KIBANA_VERSION}
+    return redirect_response(event)
+
+
+def accepted_encoding(event: dict) -> Optional[str]:
+    """ the best encoding we support from the request's accept-encoding """
+    accept_encoding = {
+        k.lower(): v for k, v in (event.get("headers") or {}).items()
+    }.get("accept-encoding", "")
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                pass
+        accepted[name.strip().lower()] = quality
+    for encoding in ["br", "gzip"]:
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_LEVEL)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+
+
+def proxied_request(
+    data: Union[bytes, str], content_type: str, encoding: Optional[str] = None
+):
+    headers = {"Content-Type": content_type, "Cache-Control": "max-age=0"}
+    if any([t in content_type for t in COMPRESSIBLE_TYPES]):
+        # the response differs by accept-encoding, whether compressed or not
+        headers["Vary"] = "Accept-Encoding"
+        if encoding and len(data) >= COMPRESS_MIN_SIZE:
+            data = compress(data, encoding)
+            headers["Content-Encoding"] = encoding
     data = base64.b64encode(data).decode("utf-8")
+    # check the size that will be returned, after compression and encoding
+    if len(data) > MAX_RESPONSE_SIZE:
+        return error_response("Response too large for the proxy", "502")
     return {
         "statusCode": "200",
         "body": data,
-        "headers": {"Content-Type": content_type, "Cache-Control": "max-age=0"},
+        "headers": headers,
         "isBase64Encoded": True,
     }
 
@@ -165,27 +381,154 @@ def valid_request():
     return all([CLOUDFRONT_CACHE_URL, AES_DOMAIN_ENDPOINT, KIBANA_BUCKET])
 
 
-def choose_request_func(event: dict) -> callable:
+def request_method(event: dict) -> str:
     if (
         event.get("queryStringParameters")
         and "method" in event["queryStringParameters"].keys()
     ):
-        return METHOD_MAP[event["queryStringParameters"]["method"].lower()]
+        return event["queryStringParameters"]["method"].lower()
     else:
-        return METHOD_MAP[event["httpMethod"].lower()]
+        return event["httpMethod"].lower()
+
+
+def choose_request_func(event: dict) -> callable:
+    return METHOD_MAP[request_method(event)]
+
+
+# responses for read only routes, kept across warm invocations
+# {key: (expires, size, saved object types, data, content_type)}
+RESPONSE_CACHE = OrderedDict()
+response_cache_size = 0
+response_cache_lock = threading.Lock()
+
+
+def saved_object_types(path: str, query: list) -> Optional[set]:
+    """ the saved object types a request reads or writes, "*" for any """
+    if SAVED_OBJECTS_PATH not in path:
+        return None
+    object_type = path.split(SAVED_OBJECTS_PATH, 1)[1].split("/")[0]
+    if object_type == "_find":
+        return {v for k, v in query if k == "type"} or {"*"}
+    if object_type.startswith("_"):
+        # _bulk_create, _import and friends can touch any type
+        return {"*"}
+    return {object_type}
+
+
+def response_cache_ttl(method: str, path: str) -> int:
+    if method != "get":
+        return 0
+    for route, ttl in RESPONSE_CACHE_ROUTES:
+        if route.search(path):
+            return ttl
+    return 0
+
+
+def response_cache_key(method: str, url: str, headers: dict) -> str:
+    """ method, path, sorted query and kbn- headers of a request """
+    split_url = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(split_url.query, keep_blank_values=True)))
+    kbn_headers = sorted(
+        (k.lower(), v) for k, v in headers.items() if k.lower().startswith("kbn-")
+    )
+    return f"{method} {split_url.path}?{query} {kbn_headers}"
+
+
+def response_cache_get(key: str) -> Optional[Tuple[bytes, str]]:
+    global response_cache_size
+    with response_cache_lock:
+        entry = RESPONSE_CACHE.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            response_cache_size -= RESPONSE_CACHE.pop(key)[1]
+            return None
+        RESPONSE_CACHE.move_to_end(key)
+        return entry[3], entry[4]
+
+
+def response_cache_put(
+    key: str, ttl: int, types: Optional[set], data: bytes, content_type: str
+):
+    global response_cache_size
+    size = len(data)
+    if size > RESPONSE_CACHE_MAX_BYTES:
+        return
+    with response_cache_lock:
+        if key in RESPONSE_CACHE:
+            response_cache_size -= RESPONSE_CACHE.pop(key)[1]
+        entry = (time.monotonic() + ttl, size, types, data, content_type)
+        RESPONSE_CACHE[key] = entry
+        response_cache_size += size
+        # evict the least recently used responses over the byte cap
+        while response_cache_size > RESPONSE_CACHE_MAX_BYTES:
+            response_cache_size -= RESPONSE_CACHE.popitem(last=False)[1][1]
+
+
+def response_cache_invalidate(types: Optional[set]):
+    """ drop cached reads of saved object types that are being written """
+    global response_cache_size
+    if not types:
+        return
+    with response_cache_lock:
+        for key, entry in list(RESPONSE_CACHE.items()):
+            cached_types = entry[2]
+            if cached_types is not None and (
+                "*" in types or "*" in cached_types or types & cached_types
+            ):
+                response_cache_size -= RESPONSE_CACHE.pop(key)[1]
+
+
+# identical reads in flight, so concurrent callers share one request to ES
+# {key: Future of (data, content_type)}
+IN_FLIGHT = {}
+in_flight_lock = threading.Lock()
+
+
+def is_read(method: str, path: str) -> bool:
+    return method in ["get", "head"] or (
+        method == "post" and READ_ONLY_POSTS.search(path) is not None
+    )
+
+
+def coalesced(key: str, request: callable) -> Tuple[Union[bytes, str], str]:
+    """ run request, or wait for the identical request already in flight """
+    with in_flight_lock:
+        future = IN_FLIGHT.get(key)
+        leader = future is None
+        if leader:
+            future = IN_FLIGHT[key] = Future()
+    if not leader:
+        return future.result()
+    try:
+        result = request()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with in_flight_lock:
+            IN_FLIGHT.pop(key, None)
 
 
 def send_to_es(
     url: str, body: dict, headers: dict, request_func: callable
 ) -> Tuple[Union[bytes, str], str]:
     # send the request to ES
-    response = request_func(url, data=body, headers=headers)
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    try:
+        response = request_func(url, body=body, headers=headers)
+    except urllib3.exceptions.HTTPError as e:
+        raise ESRequestError(str(e))
     # raise an exception if the status code of the response from ES is
     # >= 400
-    response.raise_for_status()
+    if response.status >= 400:
+        raise ESRequestError(f"{response.status} {response.reason}", response)
     # because we can deal with JSON or binary data, use the raw response
-    # content attribute
-    data = response.content
+    # data attribute
+    data = response.data
     # get the content-type returned by ES to send back to API Gateway
     content_type = response.headers.get("content-type", "").lower()
     # log a dictionary containing all of this function's arguments, as well as
@@ -225,6 +568,18 @@ def lambda_handler(event: dict, context: object) -> dict:
     if not valid_request():
         # return an error response through API Gateway
         return error_response()
+    # several requests in one invocation
+    if event["path"] == BATCH_PATH:
+        return batch_response(event)
+    return handle_request(event)
+
+
+def handle_request(event: dict) -> dict:
+    """ proxy a single request to ES, see ``lambda_handler`` """
+    # static assets already in the cache bucket are redirected without
+    # touching ES or S3 again
+    if is_static_asset(event) and cached_object(cache_key(event)):
+        return redirect_response(event)
     # validate and clean the incoming request's body data (if any)
     body = clean_body(event)
     # generate headers to send to ES, based on the incoming request headers
@@ -235,13 +590,38 @@ def lambda_handler(event: dict, context: object) -> dict:
     # will raise an unhandled KeyError if an unsupported method is found
     # within the event
     request_func = choose_request_func(event)
-    try:
-        # send the formed request to ElasticSearch
-        data, content_type = send_to_es(url, body, headers, request_func)
-    except requests.RequestException as e:
-        # the request to ES returned an error response so proxy that error
-        # back to API Gateway
-        return exception_response(e, body, params, headers)
+    # read only routes are served from memory while fresh
+    method = request_method(event)
+    split_url = urlsplit(url)
+    ttl = response_cache_ttl(method, split_url.path)
+    types = saved_object_types(split_url.path, parse_qsl(split_url.query))
+    response_key = response_cache_key(method, url, headers) if ttl else None
+    cached = response_cache_get(response_key) if ttl else None
+    if cached:
+        data, content_type = cached
+    else:
+        if method not in ["get", "head", "options"]:
+            # any write to saved objects invalidates cached reads of that type
+            response_cache_invalidate(types)
+        try:
+            # send the formed request to ElasticSearch, sharing identical
+            # reads that are already in flight
+            if is_read(method, split_url.path):
+                body_hash = hashlib.md5(
+                    body.encode("utf-8") if isinstance(body, str) else body or b""
+                ).hexdigest()
+                data, content_type = coalesced(
+                    f"{response_cache_key(method, url, headers)} {body_hash}",
+                    partial(send_to_es, url, body, headers, request_func),
+                )
+            else:
+                data, content_type = send_to_es(url, body, headers, request_func)
+        except ESRequestError as e:
+            # the request to ES returned an error response so proxy that error
+            # back to API Gateway
+            return exception_response(e, body, params, headers)
+        if ttl:
+            response_cache_put(response_key, ttl, types, data, content_type)
     # check if the returned content-type is cache-able
     if any([t in content_type for t in CACHEABLE_TYPES]):
         # if cache-able, upload the object to S3 and redirect the incoming
@@ -251,4 +631,101 @@ def lambda_handler(event: dict, context: object) -> dict:
     else:
         # if not cache-able, return the data from ES back through API Gateway
         # to the user. Sets the appropriate value for the cache-control header
-        return proxied_request(data, content_type)
+        return proxied_request(data, content_type, accepted_encoding(event))
+
+
+def batch_event(request: dict, event: dict) -> dict:
+    """ an API Gateway event for one request of a batch """
+    query = request.get("query") or {}
+    multi_value_query = {
+        k: v if isinstance(v, list) else [v] for k, v in query.items()
+    }
+    body = request.get("body")
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+    return {
+        "path": request["path"],
+        "httpMethod": request.get("method", "GET").upper(),
+        # the batch response is compressed as a whole
+        "headers": {
+            **{
+                k: v
+                for k, v in (event.get("headers") or {}).items()
+                if k.lower() != "accept-encoding"
+            },
+            **(request.get("headers") or {}),
+        },
+        "queryStringParameters": {k: v[-1] for k, v in multi_value_query.items()}
+        or None,
+        "multiValueQueryStringParameters": multi_value_query or None,
+        "body": body,
+        "isBase64Encoded": False,
+    }
+
+
+def batch_request_error(request: dict) -> Optional[str]:
+    """ why a request of a batch can't be proxied, None if it can """
+    if not isinstance(request, dict):
+        return "Batch requests must be objects"
+    path = request.get("path")
+    if not isinstance(path, str) or not path.startswith("/"):
+        return "Batch request path must be a string starting with /"
+    headers = request.get("headers")
+    if headers is not None and not (
+        isinstance(headers, dict) and all(isinstance(v, str) for v in headers.values())
+    ):
+        return "Batch request headers must be an object of strings"
+    query = request.get("query")
+    if query is not None and not (
+        isinstance(query, dict)
+        and all(
+            isinstance(v, str)
+            or (isinstance(v, list) and v and all(isinstance(i, str) for i in v))
+            for v in query.values()
+        )
+    ):
+        return "Batch request query must be an object of strings or lists of strings"
+    if not isinstance(request.get("body"), (str, dict, list, type(None))):
+        return "Batch request body must be a string, an object or a list"
+    # the method may also be overridden in the query
+    methods = f"Batch request method must be one of {sorted(METHOD_MAP)}"
+    if not isinstance(request.get("method", "GET"), str):
+        return methods
+    if request_method(batch_event(request, {})) not in METHOD_MAP:
+        return methods
+    return None
+
+
+def batch_item(request: dict, event: dict) -> dict:
+    """ proxy one request of a batch, or a 400 response if it is invalid """
+    error = batch_request_error(request)
+    if error:
+        return error_response(error, "400")
+    return handle_request(batch_event(request, event))
+
+
+def batch_response(event: dict) -> dict:
+    """
+    Proxy a batch of requests, sent as a JSON body of
+    ``{"requests": [{"method", "path", "query", "headers", "body"}, ...]}``,
+    to ES concurrently. Identical reads in the batch share one request to ES.
+    Returns ``{"responses": [...]}`` in the same order, each with the
+    statusCode, headers and base64 encoded body of the single request.
+    """
+    try:
+        batch = json.loads(clean_body(event) or "{}")["requests"]
+    except (ValueError, KeyError, TypeError):
+        return error_response("Batch body must be {\"requests\": [...]}", "400")
+    if not isinstance(batch, list) or len(batch) > BATCH_MAX_REQUESTS:
+        return error_response(
+            f"Batch must be a list of at most {BATCH_MAX_REQUESTS} requests", "400"
+        )
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as executor:
+        responses = list(executor.map(partial(batch_item, event=event), batch))
+    for response in responses:
+        # error responses carry bytes, make every body base64 text
+        if isinstance(response.get("body"), bytes):
+            response["body"] = base64.b64encode(response["body"]).decode("utf-8")
+            response["isBase64Encoded"] = True
+    data = json.dumps({"responses": responses}).encode("utf-8")
+    return proxied_request(data, "application/json", accepted_encoding(event))
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+
+# get modules
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+
+# initiate the parse
+parser = argparse.ArgumentParser(
+    description="Benchmark the logstash filter chain with log generator events"
+)
+parser.add_argument(
+    "-c",
+    "--conf",
+    dest="confs",
+    help="Logstash conf to take the filter block from, can be repeated to compare,"
+    " defaults to logstash.conf",
+    type=str,
+    action="append",
+)
+parser.add_argument(
+    "-e",
+    "--event",
+    dest="event_type",
+    help="Logged event type, the kafka topic, or both interleaved",
+    type=str,
+    choices=["apachelog", "appevent", "both"],
+    default="both",
+)
+parser.add_argument(
+    "-r",
+    "--rows",
+    dest="rows",
+    help="Number of events to measure",
+    type=int,
+    default=200000,
+)
+parser.add_argument(
+    "--warmup",
+    dest="warmup",
+    help="Number of events to send before measuring, for the jvm to warm up",
+    type=int,
+    default=50000,
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    dest="workers",
+    help="Pipeline workers, defaults to the logstash default of one per core",
+    type=int,
+)
+parser.add_argument(
+    "-b",
+    "--batch-size",
+    dest="batch_size",
+    help="Pipeline batch size, defaults to the logstash default",
+    type=int,
+)
+parser.add_argument(
+    "--logstash",
+    dest="logstash",
+    help="Path of the logstash executable",
+    type=str,
+    default="/usr/share/logstash/bin/logstash",
+)
+parser.add_argument(
+    "--docker",
+    dest="docker",
+    help="Run logstash from this docker image instead, as in the Dockerfile",
+    type=str,
+    nargs="?",
+    const="docker.elastic.co/logstash/logstash:7.6.0",
+)
+parser.add_argument(
+    "--port",
+    dest="port",
+    help="Port of the logstash monitoring api",
+    type=int,
+    default=9600,
+)
+parser.add_argument(
+    "--seed",
+    dest="seed",
+    help="Seed of the log generator, for the same events each run",
+    type=int,
+    default=1,
+)
+parser.add_argument(
+    "--save",
+    dest="save",
+    help="Save the results to a json file, as a baseline to compare with",
+    type=str,
+)
+parser.add_argument(
+    "--baseline",
+    dest="baseline",
+    help="Compare with the results saved in a json file, exit 1 on a regression",
+    type=str,
+)
+parser.add_argument(
+    "--tolerance",
+    dest="tolerance",
+    help="Fraction of the baseline events/s that can be lost before it's a regression",
+    type=float,
+    default=0.1,
+)
+
+# seconds to wait for logstash to start and for the events to pass
+START_TIMEOUT = 300
+DRAIN_TIMEOUT = 600
+# seconds between polls of the monitoring api
+POLL_INTERVAL = 0.2
+# plugin declarations inside the filter block, not conditionals
+PLUGIN_PATTERN = re.compile(r"^(\s*)(\w+)\s*\{\s*$")
+
+
+def filter_block(conf: str) -> str:
+    """ the top level filter section of a logstash conf, braces balanced past
+    quoted strings and comments """
+    depth = 0
+    start = None
+    quote = None
+    comment = False
+    for position, char in enumerate(conf):
+        if comment:
+            comment = char != "\n"
+        elif quote:
+            if char == "\\":
+                continue
+            if char == quote and conf[position - 1] != "\\":
+                quote = None
+        elif char == "#":
+            comment = True
+        elif char in "\"'":
+            quote = char
+        elif char == "{":
+            if depth == 0 and re.search(r"(?:^|\s)filter\s*$", conf[:position]):
+                start = position
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0 and start is not None:
+                return conf[start : position + 1]
+    raise SystemExit("No filter block in the logstash conf")
+
+
+def with_plugin_ids(block: str) -> str:
+    """ give each filter plugin an id of its order, name and line, so the
+    monitoring api reports it under a readable name """
+    if re.search(r"^\s*id\s*=>", block, re.MULTILINE):
+        # keep ids set in the conf
+        return block
+    lines = []
+    number = 0
+    for lineno, line in enumerate(block.splitlines(), 1):
+        lines.append(line)
+        match = PLUGIN_PATTERN.match(line)
+        if match and match.group(2) not in ("if", "else"):
+            number += 1
+            indent, name = match.groups()
+            lines.append(f'{indent}    id => "{number:02d}_{name}_line{lineno}"')
+    return "\n".join(lines)
+
+
+def bench_conf(conf_path: str) -> str:
+    """ the conf to benchmark, the filter block of a conf between a stdin input
+    and a dots output """
+    with open(conf_path, "r") as f:
+        block = with_plugin_ids(filter_block(f.read()))
+    return "\n".join(
+        [
+            "input {",
+            '  stdin { codec => "json_lines" }',
+            "}",
+            f"filter {block}",
+            "output {",
+            '  stdout { codec => "dots" }',
+            "}",
+            "",
+        ]
+    )
+
+
+def generated(event_type: str, rows: int, seed: int) -> list:
+    """ lines from the log generator """
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(dirname, "..", "filebeat", "log_generator.py"),
+            "-o",
+            "CONSOLE",
+            "-e",
+            event_type,
+            "-r",
+            str(rows),
+            "-i",
+            "0",
+            "--seed",
+            str(seed),
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+        check=True,
+    )
+    return result.stdout.splitlines()
+
+
+def events(args: argparse.Namespace, rows: int) -> list:
+    """ generator lines as filebeat ships them and the kafka input decorates
+    them, one json line each """
+    topics = [args.event_type]
+    if args.event_type == "both":
+        topics = ["apachelog", "appevent"]
+    lines = {topic: generated(topic, rows, args.seed) for topic in topics}
+    now = datetime.datetime.now(datetime.timezone.utc)
+    timestamp = now.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+    kafka_timestamp = int(now.timestamp() * 1000)
+    encoded = []
+    offsets = dict.fromkeys(topics, 0)
+    for number in range(rows):
+        topic = topics[number % len(topics)]
+        message = lines[topic][number // len(topics)]
+        event = {
+            "@timestamp": timestamp,
+            "@metadata": {
+                "kafka": {
+                    "topic": topic,
+                    "consumer_group": "logstash",
+                    "partition": "0",
+                    "offset": str(number),
+                    "timestamp": str(kafka_timestamp),
+                }
+            },
+            "message": message,
+            "fields": {"log_topic": topic},
+            "log": {
+                "offset": offsets[topic],
+                "file": {"path": f"/home/ec2-user/{topic}/{topic}.log"},
+            },
+            "input": {"type": "log"},
+            "agent": {"type": "filebeat", "version": "7.6.0"},
+        }
+        offsets[topic] += len(message) + 1
+        encoded.append(json.dumps(event) + "\n")
+    return encoded
+
+
+def logstash_command(args: argparse.Namespace, work_dir: str) -> list:
+    """ the command running logstash on the bench conf in the work dir """
+    settings = []
+    if args.workers:
+        settings += ["--pipeline.workers", str(args.workers)]
+    if args.batch_size:
+        settings += ["--pipeline.batch.size", str(args.batch_size)]
+    if args.docker:
+        return [
+            "docker",
+            "run",
+            "-i",
+            "--rm",
+            "-p",
+            f"{args.port}:9600",
+            "-e",
+            "XPACK_MONITORING_ENABLED=false",
+            "-v",
+            f"{work_dir}:/bench",
+            args.docker,
+            "-f",
+            "/bench/bench.conf",
+        ] + settings
+    return [
+        args.logstash,
+        "-f",
+        os.path.join(work_dir, "bench.conf"),
+        "--path.data",
+        os.path.join(work_dir, "data"),
+        "--path.logs",
+        os.path.join(work_dir, "logs"),
+        "--http.port",
+        str(args.port),
+    ] + settings
+
+
+def log_tail(path: str, lines: int = 20) -> str:
+    """ the last lines logstash wrote, without the dots of the events """
+    with open(path, "r", errors="replace") as f:
+        output = [line for line in f.read().splitlines() if line.strip(".")]
+    return "\n".join(output[-lines:])
+
+
+def pipeline_stats(port: int) -> dict:
+    """ the stats of the main pipeline from the monitoring api, None until it runs """
+    try:
+        with urllib.request.urlopen(
+            f"http://localhost:{port}/_node/stats/pipelines/main", timeout=5
+        ) as response:
+            stats = json.loads(response.read())
+    except (urllib.error.URLError, ConnectionError, ValueError):
+        return None
+    return stats.get("pipelines", {}).get("main")
+
+
+def wait_for(process: subprocess.Popen, port: int, events_out: int, timeout: float):
+    """ poll the monitoring api until the pipeline has sent the events out """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"logstash exited with {process.returncode}")
+        stats = pipeline_stats(port)
+        if stats and stats["events"]["out"] >= events_out:
+            return stats
+        time.sleep(POLL_INTERVAL)
+    raise RuntimeError(f"timed out waiting for {events_out:,} events out")
+
+
+def filter_costs(before: dict, after: dict) -> dict:
+    """ events in and milliseconds of each filter plugin between two stats """
+    start = {plugin["id"]: plugin for plugin in before["plugins"]["filters"]}
+    costs = {}
+    for plugin in after["plugins"]["filters"]:
+        events_in = plugin.get("events", {}).get("in", 0)
+        millis = plugin.get("events", {}).get("duration_in_millis", 0)
+        if plugin["id"] in start:
+            events_in -= start[plugin["id"]].get("events", {}).get("in", 0)
+            millis -= start[plugin["id"]].get("events", {}).get("duration_in_millis", 0)
+        costs[plugin["id"]] = {"events": events_in, "millis": millis}
+    return costs
+
+
+def benchmark(args: argparse.Namespace, conf_path: str, lines: list) -> dict:
+    """ run logstash on the filter block of a conf, return events/s and the cost
+    of each filter """
+    with tempfile.TemporaryDirectory() as work_dir:
+        # world readable, for the logstash user of the docker image
+        os.chmod(work_dir, 0o755)
+        with open(os.path.join(work_dir, "bench.conf"), "w") as f:
+            f.write(bench_conf(conf_path))
+        command = logstash_command(args, work_dir)
+
+        # validate the conf first, as the Dockerfile does
+        check = subprocess.run(
+            command + ["--config.test_and_exit"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+        if check.returncode != 0:
+            raise RuntimeError(f"config test failed\n{check.stdout[-4000:]}")
+
+        output_path = os.path.join(work_dir, "logstash.out")
+        with open(output_path, "w") as output:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=output,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+            )
+            try:
+                deadline = time.time() + START_TIMEOUT
+                while pipeline_stats(args.port) is None:
+                    if process.poll() is not None or time.time() > deadline:
+                        raise RuntimeError("logstash did not start")
+                    time.sleep(POLL_INTERVAL)
+
+                # warm up, then measure between two snapshots of the stats
+                warmup, measured = lines[: args.warmup], lines[args.warmup :]
+                process.stdin.writelines(warmup)
+                process.stdin.flush()
+                before = wait_for(process, args.port, len(warmup), DRAIN_TIMEOUT)
+                started = time.perf_counter()
+                process.stdin.writelines(measured)
+                process.stdin.flush()
+                after = wait_for(process, args.port, len(lines), DRAIN_TIMEOUT)
+                elapsed = time.perf_counter() - started
+            except (RuntimeError, BrokenPipeError) as err:
+                process.kill()
+                process.wait()
+                raise RuntimeError(f"{err}\n{log_tail(output_path)}")
+            # stdin closed ends the pipeline
+            process.stdin.close()
+            process.wait()
+
+    measured_events = after["events"]["out"] - before["events"]["out"]
+    return {
+        "events_per_second": measured_events / elapsed,
+        "filter_millis": after["events"].get("duration_in_millis", 0)
+        - before["events"].get("duration_in_millis", 0),
+        "events": measured_events,
+        "filters": filter_costs(before, after),
+    }
+
+
+def report(conf_path: str, result: dict, baseline: dict, tolerance: float) -> bool:
+    """ print the results of a conf, return False on a regression """
+    print(f"{conf_path}")
+    print(
+        f"  {result['events']:,} events at {result['events_per_second']:,.0f} events/s"
+    )
+    total = sum(cost["millis"] for cost in result["filters"].values()) or 1
+    print(f"  {'filter':36} {'events':>10} {'us/event':>9} {'share':>6}")
+    for plugin_id, cost in sorted(result["filters"].items()):
+        per_event = cost["millis"] * 1000 / cost["events"] if cost["events"] else 0
+        print(
+            f"  {plugin_id:36} {cost['events']:10,} {per_event:9.2f}"
+            f" {cost['millis'] / total:6.1%}"
+        )
+    if not baseline:
+        return True
+    change = result["events_per_second"] / baseline["events_per_second"] - 1
+    print(
+        f"  {change:+.1%} against the baseline"
+        f" {baseline['events_per_second']:,.0f} events/s"
+    )
+    return change >= -tolerance
+
+
+def main():
+    args = parser.parse_args()
+    confs = args.confs or [os.path.join(dirname, "logstash.conf")]
+    if args.rows < 1 or args.warmup < 0:
+        parser.error("Needs at least one row and no negative warmup")
+
+    baselines = {}
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baselines = json.load(f)
+
+    # the same events for every conf
+    lines = events(args, args.warmup + args.rows)
+    results = {}
+    passed = True
+    for conf_path in confs:
+        name = os.path.basename(conf_path)
+        results[name] = benchmark(args, conf_path, lines)
+        passed &= report(
+            conf_path, results[name], baselines.get(name), args.tolerance
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if not passed:
+        print("events/s regressed beyond the tolerance", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# modules
+import os
+import json
+import logging
+import boto3
+from kafka import KafkaAdminClient, KafkaConsumer, TopicPartition
+
+# settings ...
+KAFKA_BROKERS = os.environ.get("KAFKA_BROKERS", "")
+# the consumer group reading each topic, as json
+CONSUMER_GROUPS = json.loads(os.environ.get("CONSUMER_GROUPS", "{}"))
+METRIC_NAMESPACE = os.environ.get("METRIC_NAMESPACE", "elkk/logstash")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "warning")
+
+logger = logging.getLogger()
+logger.setLevel(LOG_LEVEL.upper())
+
+# clients are reused by warm invocations
+cloudwatch = boto3.client("cloudwatch")
+
+
+def topic_lag(
+    consumer: KafkaConsumer, admin: KafkaAdminClient, topic: str, group: str
+) -> int:
+    """ messages of a topic the consumer group has still to read """
+    partitions = [
+        TopicPartition(topic, partition)
+        for partition in consumer.partitions_for_topic(topic) or []
+    ]
+    if not partitions:
+        return 0
+    end_offsets = consumer.end_offsets(partitions)
+    committed = admin.list_consumer_group_offsets(group, partitions=partitions)
+    beginning_offsets = None
+    lag = 0
+    for partition in partitions:
+        offset = committed.get(partition)
+        if offset is None or offset.offset < 0:
+            # logstash reads a partition without a commit from the earliest
+            # offset, so all of its retained messages are still to read
+            if beginning_offsets is None:
+                beginning_offsets = consumer.beginning_offsets(partitions)
+            start = beginning_offsets[partition]
+        else:
+            start = offset.offset
+        lag += max(end_offsets[partition] - start, 0)
+    return lag
+
+
+def lambda_handler(event: dict, context: object) -> dict:
+    brokers = KAFKA_BROKERS.split(",")
+    consumer = KafkaConsumer(bootstrap_servers=brokers, client_id="elkk-lag")
+    admin = KafkaAdminClient(bootstrap_servers=brokers, client_id="elkk-lag")
+    try:
+        lags = {
+            topic: topic_lag(consumer, admin, topic, group)
+            for topic, group in CONSUMER_GROUPS.items()
+        }
+    finally:
+        consumer.close()
+        admin.close()
+
+    # the lag of each topic, and of them all to scale on
+    metric_data = [
+        {
+            "MetricName": "ConsumerLag",
+            "Dimensions": [
+                {"Name": "Topic", "Value": topic},
+                {"Name": "ConsumerGroup", "Value": CONSUMER_GROUPS[topic]},
+            ],
+            "Value": lag,
+            "Unit": "Count",
+        }
+        for topic, lag in lags.items()
+    ]
+    metric_data.append(
+        {"MetricName": "TotalConsumerLag", "Value": sum(lags.values()), "Unit": "Count"}
+    )
+    cloudwatch.put_metric_data(Namespace=METRIC_NAMESPACE, MetricData=metric_data)
+    logger.info(f"consumer lag {lags}")
+    return lags
@@ -1,6 +1,6 @@
 # import modules
 import os
-import urllib.request
+import json
 from aws_cdk import (
     core,
     aws_ec2 as ec2,
@@ -9,22 +9,26 @@ from aws_cdk import (
     aws_ecs as ecs,
     aws_ecr_assets as ecr_assets,
     aws_logs as logs,
+    aws_lambda as lambda_,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_cloudwatch as cloudwatch,
+    aws_applicationautoscaling as appscaling,
 )
 from helpers.constants import constants
+from helpers.discovery import discover
 from helpers.functions import (
-    file_updated,
-    kafka_get_brokers,
+    PipBundling,
+    logstash_consumer_groups,
+    logstash_task_cap,
+    pipeline_confs,
+    pipelines_updated,
     user_data_init,
+    get_external_ip,
     instance_add_log_permissions,
-    get_log_group_arn,
 )
-import boto3
-from botocore.exceptions import ClientError
-
-logs_client = boto3.client("logs")
 
 dirname = os.path.dirname(__file__)
-external_ip = urllib.request.urlopen("https://ident.me").read().decode("utf8")
 
 
 class LogstashStack(core.Stack):
@@ -35,42 +39,14 @@ class LogstashStack(core.Stack):
         vpc_stack,
         logstash_ec2=True,
         logstash_fargate=True,
+        discovery: dict = None,
         **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
-        # get s3 bucket name
-        s3client = boto3.client("s3")
-        s3_bucket_list = s3client.list_buckets()
-        s3_bucket_name = ""
-        for bkt in s3_bucket_list["Buckets"]:
-            try:
-                bkt_tags = s3client.get_bucket_tagging(Bucket=bkt["Name"])["TagSet"]
-                for keypairs in bkt_tags:
-                    if (
-                        keypairs["Key"] == "aws:cloudformation:stack-name"
-                        and keypairs["Value"] == "elkk-athena"
-                    ):
-                        s3_bucket_name = bkt["Name"]
-            except ClientError as err:
-                if err.response["Error"]["Code"] in ["NoSuchTagSet", "NoSuchBucket"]:
-                    pass
-                else:
-                    print(f"Unexpectedd error: {err}")
-
-        # get elastic endpoint
-        esclient = boto3.client("es")
-        es_domains = esclient.list_domain_names()
-        try:
-            es_domain = [
-                dom["DomainName"]
-                for dom in es_domains["DomainNames"]
-                if "elkk-" in dom["DomainName"]
-            ][0]
-            es_endpoint = esclient.describe_elasticsearch_domain(DomainName=es_domain)
-            es_endpoint = es_endpoint["DomainStatus"]["Endpoints"]["vpc"]
-        except IndexError:
-            es_endpoint = ""
+        # existing resources from the discovery
+        if discovery is None:
+            discovery = discover()
 
         # assets for logstash stack
         logstash_yml = assets.Asset(
@@ -80,18 +56,33 @@ class LogstashStack(core.Stack):
             self, "logstash_repo", path=os.path.join(dirname, "logstash.repo")
         )
 
-        # update conf file to .asset
+        # update the chosen conf file to a .conf.asset per pipeline, as the Dockerfile adds
         # kafka brokerstring does not need reformatting
-        logstash_conf_asset = file_updated(
-            os.path.join(dirname, "logstash.conf"),
+        logstash_conf_assets = pipeline_confs(
+            os.path.join(dirname, constants["LOGSTASH_CONF"]),
             {
-                "$s3_bucket": s3_bucket_name,
-                "$es_endpoint": es_endpoint,
-                "$kafka_brokers": kafka_get_brokers(),
+                "$s3_bucket": discovery["athena_bucket"],
+                "$es_endpoint": discovery["elastic_endpoint"],
+                "$kafka_brokers": discovery["kafka_brokers"],
                 "$elkk_region": os.environ["CDK_DEFAULT_REGION"],
             },
         )
-        logstash_conf = assets.Asset(self, "logstash.conf", path=logstash_conf_asset,)
+        logstash_confs = {
+            pipeline_id: assets.Asset(self, f"{pipeline_id}.conf", path=conf_asset)
+            for pipeline_id, conf_asset in logstash_conf_assets.items()
+        }
+        # pipelines.yml for the instance, and for the container as the Dockerfile adds
+        logstash_pipelines = assets.Asset(
+            self,
+            "logstash_pipelines",
+            path=pipelines_updated(
+                os.path.join(dirname, "pipelines_instance.yml.asset"),
+                "/etc/logstash/conf.d",
+            ),
+        )
+        pipelines_updated(
+            os.path.join(dirname, "pipelines.yml.asset"), "/usr/share/logstash/pipeline"
+        )
 
         # logstash security group
         logstash_security_group = ec2.SecurityGroup(
@@ -104,53 +95,38 @@ class LogstashStack(core.Stack):
         core.Tag.add(logstash_security_group, "project", constants["PROJECT_TAG"])
         core.Tag.add(logstash_security_group, "Name", "logstash_sg")
 
+        # operator public ip for ssh
+        external_ip = get_external_ip(self)
         # Open port 22 for SSH
         logstash_security_group.add_ingress_rule(
             ec2.Peer.ipv4(f"{external_ip}/32"), ec2.Port.tcp(22), "from own public ip",
         )
 
-        # get security group for kafka
-        ec2client = boto3.client("ec2")
-        security_groups = ec2client.describe_security_groups(
-            Filters=[{"Name": "tag-value", "Values": [constants["PROJECT_TAG"],]},],
-        )
-
         # if kafka sg does not exist ... don't add it
-        try:
-            kafka_sg_id = [
-                sg["GroupId"]
-                for sg in security_groups["SecurityGroups"]
-                if "kafka security group" in sg["Description"]
-            ][0]
+        if discovery["kafka_security_group"]:
             kafka_security_group = ec2.SecurityGroup.from_security_group_id(
-                self, "kafka_security_group", security_group_id=kafka_sg_id
+                self,
+                "kafka_security_group",
+                security_group_id=discovery["kafka_security_group"],
             )
 
             # let in logstash
             kafka_security_group.connections.allow_from(
                 logstash_security_group, ec2.Port.all_traffic(), "from logstash",
             )
-        except IndexError:
-            # print("kafka_sg_id and kafka_security_group not found")
-            pass
 
         # get security group for elastic
-        try:
-            elastic_sg_id = [
-                sg["GroupId"]
-                for sg in security_groups["SecurityGroups"]
-                if "elastic security group" in sg["Description"]
-            ][0]
+        if discovery["elastic_security_group"]:
             elastic_security_group = ec2.SecurityGroup.from_security_group_id(
-                self, "elastic_security_group", security_group_id=elastic_sg_id
+                self,
+                "elastic_security_group",
+                security_group_id=discovery["elastic_security_group"],
             )
 
             # let in logstash
             elastic_security_group.connections.allow_from(
                 logstash_security_group, ec2.Port.all_traffic(), "from logstash",
             )
-        except IndexError:
-            pass
 
         # elastic policy
         access_elastic_policy = iam.PolicyStatement(
@@ -200,7 +176,9 @@ class LogstashStack(core.Stack):
             # add access to the file assets
             logstash_yml.grant_read(logstash_instance)
             logstash_repo.grant_read(logstash_instance)
-            logstash_conf.grant_read(logstash_instance)
+            logstash_pipelines.grant_read(logstash_instance)
+            for logstash_conf in logstash_confs.values():
+                logstash_conf.grant_read(logstash_instance)
 
             # add permissions to instance
             logstash_instance.add_to_role_policy(statement=access_elastic_policy)
@@ -215,7 +193,11 @@ class LogstashStack(core.Stack):
                 # get setup assets files
                 f"aws s3 cp s3://{logstash_yml.s3_bucket_name}/{logstash_yml.s3_object_key} /home/ec2-user/logstash.yml",
                 f"aws s3 cp s3://{logstash_repo.s3_bucket_name}/{logstash_repo.s3_object_key} /home/ec2-user/logstash.repo",
-                f"aws s3 cp s3://{logstash_conf.s3_bucket_name}/{logstash_conf.s3_object_key} /home/ec2-user/logstash.conf",
+                f"aws s3 cp s3://{logstash_pipelines.s3_bucket_name}/{logstash_pipelines.s3_object_key} /home/ec2-user/pipelines.yml",
+                *[
+                    f"aws s3 cp s3://{logstash_conf.s3_bucket_name}/{logstash_conf.s3_object_key} /home/ec2-user/{pipeline_id}.conf"
+                    for pipeline_id, logstash_conf in logstash_confs.items()
+                ],
                 # install java
                 "amazon-linux-extras install java-openjdk11 -y",
                 # install git
@@ -234,8 +216,12 @@ class LogstashStack(core.Stack):
                 "usermod -a -G logstash ec2-user",
                 # move logstash.yml to final location
                 "mv -f /home/ec2-user/logstash.yml /etc/logstash/logstash.yml",
-                # move logstash.conf to final location
-                "mv -f /home/ec2-user/logstash.conf /etc/logstash/conf.d/logstash.conf",
+                # move the pipeline confs and pipelines.yml to final location
+                *[
+                    f"mv -f /home/ec2-user/{pipeline_id}.conf /etc/logstash/conf.d/{pipeline_id}.conf"
+                    for pipeline_id in logstash_confs
+                ],
+                "mv -f /home/ec2-user/pipelines.yml /etc/logstash/pipelines.yml",
                 # move plugin
                 "mkdir /usr/share/logstash/plugins",
                 "mv -f /home/ec2-user/logstash-output-amazon_es /usr/share/logstash/plugins/logstash-output-amazon_es",
@@ -294,22 +280,121 @@ class LogstashStack(core.Stack):
             logstash_task.add_to_task_role_policy(access_elastic_policy)
 
             # the service
-            logstash_service = (
-                ecs.FargateService(
-                    self,
-                    "logstash_service",
-                    cluster=logstash_cluster,
-                    task_definition=logstash_task,
-                    security_group=logstash_security_group,
-                    deployment_controller=ecs.DeploymentController(
-                        type=ecs.DeploymentControllerType.ECS
+            logstash_service = ecs.FargateService(
+                self,
+                "logstash_service",
+                cluster=logstash_cluster,
+                task_definition=logstash_task,
+                security_group=logstash_security_group,
+                deployment_controller=ecs.DeploymentController(
+                    type=ecs.DeploymentControllerType.ECS
+                ),
+            )
+
+            # lambda to publish the consumer lag of the logstash topics
+            logstash_lag_lambda = lambda_.Function(
+                self,
+                "logstash_lag_lambda",
+                description="publish the logstash kafka consumer lag to cloudwatch",
+                code=lambda_.Code.from_asset(
+                    os.path.join(dirname, "lag_lambda"),
+                    bundling=core.BundlingOptions(
+                        local=PipBundling(os.path.join(dirname, "lag_lambda")),
+                        image=lambda_.Runtime.PYTHON_3_8.bundling_image,
+                        command=[
+                            "bash",
+                            "-c",
+                            "pip install -r requirements.txt -t /asset-output"
+                            " && cp -au . /asset-output",
+                        ],
                     ),
+                ),
+                handler="lag_function.lambda_handler",
+                runtime=lambda_.Runtime.PYTHON_3_8,
+                timeout=core.Duration.seconds(60),
+                vpc=vpc_stack.get_vpc,
+                security_groups=[logstash_security_group],
+                log_retention=logs.RetentionDays.ONE_WEEK,
+                environment={
+                    "KAFKA_BROKERS": discovery["kafka_brokers"],
+                    "CONSUMER_GROUPS": json.dumps(logstash_consumer_groups()),
+                    "METRIC_NAMESPACE": constants["LOGSTASH_LAG_NAMESPACE"],
+                },
+            )
+            logstash_lag_lambda.add_to_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["cloudwatch:PutMetricData"],
+                    resources=["*"],
                 )
-                .auto_scale_task_count(min_capacity=3, max_capacity=10)
-                .scale_on_cpu_utilization(
-                    "logstash_scaling",
-                    target_utilization_percent=75,
-                    scale_in_cooldown=core.Duration.seconds(60),
-                    scale_out_cooldown=core.Duration.seconds(60),
-                )
+            )
+            core.Tag.add(logstash_lag_lambda, "project", constants["PROJECT_TAG"])
+
+            # run the lambda every minute
+            logstash_lag_rule = events.Rule(
+                self,
+                "logstash_lag_rule",
+                schedule=events.Schedule.rate(core.Duration.minutes(1)),
+                targets=[targets.LambdaFunction(logstash_lag_lambda)],
+            )
+
+            # scale the tasks, no more than can each read a partition
+            max_capacity = min(
+                constants["LOGSTASH_FARGATE_MAX_CAPACITY"], logstash_task_cap()
+            )
+            logstash_scaling = logstash_service.auto_scale_task_count(
+                min_capacity=min(
+                    constants["LOGSTASH_FARGATE_MIN_CAPACITY"], max_capacity
+                ),
+                max_capacity=max_capacity,
+            )
+            # cpu adds tasks for heavy filters, the lag removes them, so an
+            # idle cpu behind a backed up elasticsearch doesn't scale them in
+            logstash_scaling.scale_on_cpu_utilization(
+                "logstash_scaling",
+                target_utilization_percent=75,
+                disable_scale_in=True,
+                scale_out_cooldown=core.Duration.seconds(60),
+            )
+            lag_scaling = constants["LOGSTASH_LAG_SCALING"]
+            lag_metric = cloudwatch.Metric(
+                namespace=constants["LOGSTASH_LAG_NAMESPACE"],
+                metric_name="TotalConsumerLag",
+                statistic="Maximum",
+                period=core.Duration.minutes(1),
+            )
+            # scale out on the lag, no change below the first step
+            logstash_scaling.scale_on_metric(
+                "logstash_lag_scaling",
+                metric=lag_metric,
+                scaling_steps=[
+                    appscaling.ScalingInterval(
+                        upper=lag_scaling["out"][0]["lower"], change=0
+                    )
+                ]
+                + [
+                    appscaling.ScalingInterval(
+                        lower=step["lower"], change=step["change"]
+                    )
+                    for step in lag_scaling["out"]
+                ],
+                adjustment_type=appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+                cooldown=core.Duration.seconds(120),
+            )
+            # scale in once the lag has stayed low, tasks are kept in between
+            logstash_scaling.scale_on_metric(
+                "logstash_lag_scale_in",
+                metric=lag_metric,
+                scaling_steps=[
+                    appscaling.ScalingInterval(
+                        upper=lag_scaling["in"]["upper"],
+                        change=lag_scaling["in"]["change"],
+                    ),
+                    appscaling.ScalingInterval(
+                        lower=lag_scaling["in"]["upper"], change=0
+                    ),
+                ],
+                adjustment_type=appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+                evaluation_periods=lag_scaling["in"]["minutes"],
+                cooldown=core.Duration.minutes(lag_scaling["in"]["minutes"]),
             )
@@ -29,6 +29,10 @@ setuptools.setup(
         "aws_cdk.aws_ecs",
         "aws_cdk.aws_ecr_assets",
         "aws_cdk.aws_glue",
+        "aws_cdk.aws_events",
+        "aws_cdk.aws_events_targets",
+        "aws_cdk.aws_cloudwatch",
+        "aws_cdk.aws_applicationautoscaling",
         "boto3",
     ],
     python_requires=">=3.6",
@@ -0,0 +1,103 @@
+# tests of the logstash consumer lag lambda, against in-process stand-ins for
+# the kafka-python consumer and admin clients
+import os
+import sys
+import types
+import collections
+import importlib.util
+from unittest import mock
+
+dirname = os.path.dirname(__file__)
+
+# as kafka-python's, the clients are the stand-ins below
+TopicPartition = collections.namedtuple("TopicPartition", ["topic", "partition"])
+kafka = types.SimpleNamespace(
+    KafkaAdminClient=None, KafkaConsumer=None, TopicPartition=TopicPartition
+)
+
+# the cloudwatch client is created on import
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+spec = importlib.util.spec_from_file_location(
+    "lag_function",
+    os.path.join(dirname, "..", "logstash", "lag_lambda", "lag_function.py"),
+)
+lag_function = importlib.util.module_from_spec(spec)
+with mock.patch.dict(sys.modules, {"kafka": kafka}):
+    spec.loader.exec_module(lag_function)
+
+
+class FakeConsumer:
+    """ the partitions of each topic, with their beginning and end offsets """
+
+    def __init__(self, offsets: dict):
+        # {topic: [(beginning, end), ...]}
+        self.offsets = offsets
+
+    def partitions_for_topic(self, topic: str) -> set:
+        if topic not in self.offsets:
+            return None
+        return set(range(len(self.offsets[topic])))
+
+    def beginning_offsets(self, partitions: list) -> dict:
+        return {tp: self.offsets[tp.topic][tp.partition][0] for tp in partitions}
+
+    def end_offsets(self, partitions: list) -> dict:
+        return {tp: self.offsets[tp.topic][tp.partition][1] for tp in partitions}
+
+
+class FakeAdmin:
+    """ the committed offsets of each consumer group """
+
+    def __init__(self, committed: dict):
+        # {group: {TopicPartition: offset}}
+        self.committed = committed
+
+    def list_consumer_group_offsets(self, group: str, partitions: list) -> dict:
+        return {
+            tp: types.SimpleNamespace(offset=offset, metadata="")
+            for tp, offset in self.committed.get(group, {}).items()
+            if tp in partitions
+        }
+
+
+def test_lag_from_committed_offsets():
+    consumer = FakeConsumer({"apachelog": [(0, 100), (50, 300)]})
+    admin = FakeAdmin(
+        {
+            "logstash-apachelog": {
+                TopicPartition("apachelog", 0): 90,
+                TopicPartition("apachelog", 1): 200,
+            }
+        }
+    )
+    lag = lag_function.topic_lag(consumer, admin, "apachelog", "logstash-apachelog")
+    assert lag == 10 + 100
+
+
+def test_group_without_commits_lags_by_the_retained_messages():
+    # a new group reads from the earliest offset, not the latest
+    consumer = FakeConsumer({"appevent": [(1000, 5000), (0, 250)]})
+    admin = FakeAdmin({})
+    lag = lag_function.topic_lag(consumer, admin, "appevent", "logstash-appevent")
+    assert lag == 4000 + 250
+
+
+def test_partitions_without_commits_counted_from_the_beginning():
+    consumer = FakeConsumer({"appevent": [(0, 100), (20, 80)]})
+    admin = FakeAdmin(
+        {
+            "logstash-appevent": {
+                TopicPartition("appevent", 0): 100,
+                # no offset committed
+                TopicPartition("appevent", 1): -1,
+            }
+        }
+    )
+    lag = lag_function.topic_lag(consumer, admin, "appevent", "logstash-appevent")
+    assert lag == 0 + 60
+
+
+def test_missing_topic_has_no_lag():
+    consumer = FakeConsumer({})
+    admin = FakeAdmin({})
+    assert lag_function.topic_lag(consumer, admin, "elkktopic", "logstash-other") == 0
@@ -0,0 +1,203 @@
+# tests of the log generator kafka output, against an in-process stand-in
+# for the confluent-kafka producer
+import os
+import sys
+import types
+import importlib.util
+
+import pytest
+
+dirname = os.path.dirname(__file__)
+
+# the log generator is a script, not part of a package
+spec = importlib.util.spec_from_file_location(
+    "log_generator", os.path.join(dirname, "..", "filebeat", "log_generator.py")
+)
+log_generator = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(log_generator)
+
+
+class FakeMessage:
+    """ the delivered message passed to the delivery callback """
+
+    def __init__(self, topic: str, value: bytes):
+        self._topic = topic
+        self._value = value
+
+    def topic(self) -> str:
+        return self._topic
+
+    def value(self) -> bytes:
+        return self._value
+
+
+class FakeProducer:
+    """ a local broker stand-in, queues messages until polled or flushed, then
+    delivers them to their callbacks """
+
+    def __init__(self, config: dict, capacity: int = 100000, fail=None):
+        self.config = config
+        self.capacity = capacity
+        # messages that fail delivery
+        self.fail = fail or (lambda value: False)
+        # when False, flush leaves the queue undelivered, as a down broker
+        self.reachable = True
+        self.queue = []
+        self.delivered = []
+        self.full = 0
+        self.polls = []
+
+    def produce(self, topic: str, value, on_delivery=None):
+        if len(self.queue) >= self.capacity:
+            self.full += 1
+            raise BufferError("Local: Queue full")
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        self.queue.append((topic, value, on_delivery))
+
+    def poll(self, timeout: float = None) -> int:
+        self.polls.append(timeout)
+        if not self.reachable:
+            return 0
+        queued, self.queue = self.queue, []
+        for topic, value, on_delivery in queued:
+            err = "delivery failed" if self.fail(value) else None
+            if err is None:
+                self.delivered.append((topic, value))
+            if on_delivery:
+                on_delivery(err, FakeMessage(topic, value))
+        return len(queued)
+
+    def flush(self, timeout: float = None) -> int:
+        self.poll(timeout)
+        return len(self.queue)
+
+
+class Producers(list):
+    """ the producers created, and the settings to create the next ones with """
+
+    def __init__(self):
+        super().__init__()
+        self.settings = {}
+
+    def __call__(self, config: dict) -> FakeProducer:
+        self.append(FakeProducer(config, **self.settings))
+        return self[-1]
+
+
+@pytest.fixture
+def producers(monkeypatch):
+    """ the producers the kafka output creates, with confluent_kafka faked """
+    created = Producers()
+    monkeypatch.setitem(
+        sys.modules, "confluent_kafka", types.SimpleNamespace(Producer=created)
+    )
+    return created
+
+
+def kafka_args(*args):
+    """ the log generator args for a kafka output """
+    return log_generator.parser.parse_args(
+        ["-o", "KAFKA", "--brokers", "b-1:9092,b-2:9092", *args]
+    )
+
+
+def lines(count: int, text: str = "line") -> list:
+    return [f"{text} {number}\n" for number in range(count)]
+
+
+def test_producer_settings_passed_through(producers):
+    log_generator.KafkaLog(
+        kafka_args(
+            "--linger-ms",
+            "50",
+            "--batch-kb",
+            "64",
+            "--compression",
+            "zstd",
+            "--acks",
+            "all",
+        )
+    )
+    assert producers[0].config == {
+        "bootstrap.servers": "b-1:9092,b-2:9092",
+        "linger.ms": 50,
+        "batch.size": 64 * 1024,
+        "compression.type": "zstd",
+        "acks": "all",
+    }
+
+
+def test_needs_brokers(producers):
+    with pytest.raises(SystemExit):
+        log_generator.KafkaLog(kafka_args("--brokers", ""))
+    assert not producers
+
+
+def test_write_batches_lines_to_the_topic(producers):
+    log = log_generator.KafkaLog(kafka_args("-e", "appevent"))
+    batch = lines(2500)
+    assert log.write(batch) == sum(map(len, batch))
+    log.close()
+    producer = producers[0]
+    # topic defaults to the event type, lines are sent without the new line
+    assert {topic for topic, value in producer.delivered} == {"appevent"}
+    assert [value for topic, value in producer.delivered] == [
+        line[:-1].encode("utf-8") for line in batch
+    ]
+
+
+def test_topic_option(producers):
+    log = log_generator.KafkaLog(kafka_args("--topic", "elkktopic"))
+    log.write(lines(3))
+    log.close()
+    assert {topic for topic, value in producers[0].delivered} == {"elkktopic"}
+
+
+def test_delivery_latencies_collected(producers, monkeypatch):
+    log = log_generator.KafkaLog(kafka_args())
+    # queued at 100s, delivered 20ms later
+    clock = iter([100.0])
+    monkeypatch.setattr(
+        log_generator.time, "monotonic", lambda: next(clock, 100.02)
+    )
+    log.write(lines(500))
+    monkeypatch.undo()
+    assert log.latencies.count == 500
+    assert log.failed == 0
+    # within the 5% bucket of 20 ms
+    assert 19 <= log.latencies.percentile(50) <= 21
+    assert 19 <= log.latencies.percentile(99) <= 21
+
+
+def test_failed_deliveries_counted(producers, capsys):
+    producers.settings["fail"] = lambda value: value.startswith(b"bad")
+    log = log_generator.KafkaLog(kafka_args())
+    log.write(lines(30, "good") + lines(12, "bad"))
+    log.close()
+    assert log.failed == 12
+    assert log.latencies.count == 30
+    assert len(producers[0].delivered) == 30
+    assert "12 failed" in capsys.readouterr().err
+
+
+def test_full_local_queue_drained(producers):
+    producers.settings["capacity"] = 10
+    log = log_generator.KafkaLog(kafka_args())
+    batch = lines(95)
+    log.write(batch)
+    log.close()
+    producer = producers[0]
+    # every full queue was polled to make room, no line was dropped
+    assert producer.full > 0
+    assert producer.polls.count(0.1) == producer.full
+    assert len(producer.delivered) == len(batch)
+    assert log.latencies.count == len(batch)
+
+
+def test_undelivered_reported_on_close(producers, capsys):
+    log = log_generator.KafkaLog(kafka_args())
+    producers[0].reachable = False
+    log.write(lines(7))
+    log.close()
+    assert "7 undelivered" in capsys.readouterr().err